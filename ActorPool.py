@@ -0,0 +1,193 @@
+import itertools as it
+import multiprocessing as mp
+import queue
+from collections import namedtuple
+from time import time
+
+import numpy as np
+import torch
+
+from DoomEnv import DoomEnv
+from DuelQNet import build_duel_qnet
+from inference import InferenceQNet
+from quantization import QuantizedQNet
+from level_catalog import load_level_details
+from levdoom_utils import create_doom_game
+from weight_broadcast import SharedWeights
+
+
+# transitions of one actor, in the order it played them. next_states of
+# terminal transitions are zeros, scores are the episodes finished in the
+# chunk and acting_time the seconds spent producing it
+Chunk = namedtuple(
+    "Chunk",
+    ["actor", "states", "actions", "rewards", "next_states", "dones", "scores", "acting_time"],
+)
+
+
+def actor_epsilon(index, num_actors, base=0.4, alpha=7.0):
+    """Fixed exploration rate of actor index, epsilon_i = base ** (1 + alpha * i / (N - 1)) as in Ape-X"""
+    if num_actors == 1:
+        return base
+    return base ** (1 + alpha * index / (num_actors - 1))
+
+
+def _actor(index, level_name, agent_config, epsilon, chunk_size, transitions, weights, ready, stop):
+    """Plays epsilon-greedy with a CPU copy of the learner's q_net and sends the transitions in chunks"""
+    torch.set_num_threads(1)
+
+    doom_env = DoomEnv(level_name, agent_config)
+    n = doom_env.get_action_space_size()
+    action_list = [list(a) for a in it.product([0, 1], repeat=n)]
+    q_net = build_duel_qnet(agent_config, len(action_list))
+    q_net.eval()
+    policy_net = InferenceQNet(q_net, agent_config.inference_backend)
+    version = 0
+    ready.put(index)
+
+    try:
+        state = doom_env.reset()
+        states = None
+        while not stop.is_set():
+            latest = weights.pull(q_net, version)
+            if agent_config.int8_acting and latest != version and states is not None:
+                # int8 snapshot of the new weights, calibrated on the last chunk
+                policy_net = QuantizedQNet(q_net, torch.from_numpy(states))
+            version = latest
+            start = time()
+
+            # a new chunk every time, the queue pickles it in the background
+            states = np.empty((chunk_size, *doom_env.state_shape), dtype=np.float32)
+            next_states = np.zeros((chunk_size, *doom_env.state_shape), dtype=np.float32)
+            actions = np.empty(chunk_size, dtype=np.int64)
+            rewards = np.empty(chunk_size, dtype=np.float32)
+            dones = np.empty(chunk_size, dtype=np.bool_)
+            scores = []
+
+            for i in range(chunk_size):
+                if np.random.uniform() < epsilon:
+                    action = np.random.randint(len(action_list))
+                else:
+                    action = torch.argmax(policy_net(torch.from_numpy(state[np.newaxis]))).item()
+
+                # terminal steps don't write next_states[i], which stays zeros
+                _, reward, done = doom_env.step(action_list[action], agent_config.frame_repeat, out=next_states[i])
+                states[i] = state
+                actions[i] = action
+                rewards[i] = reward
+                dones[i] = done
+
+                if done:
+                    scores.append(doom_env.episode_reward)
+                    state = doom_env.reset()
+                else:
+                    state = next_states[i]
+
+            chunk = Chunk(index, states, actions, rewards, next_states, dones, scores, time() - start)
+            # blocks while the learner is behind its update-to-data ratio
+            while not stop.is_set():
+                try:
+                    transitions.put(chunk, timeout=0.1)
+                    break
+                except queue.Full:
+                    continue
+    finally:
+        # chunks still buffered are dropped rather than blocking the exit
+        transitions.cancel_join_thread()
+        doom_env.close_env()
+
+
+class ActorPool:
+    """
+    Ape-X style actors: num_actors processes, each with its own DoomEnv and a
+    CPU DuelQNet, playing with a fixed epsilon from actor_epsilon and
+    streaming their transitions to the learner in chunks of chunk_size.
+
+    At most queue_size chunks wait for the learner, beyond that the actors
+    block, which is what holds them to the learner's pace. The learner shares
+    its q_net weights with publish(), which the actors pull before each chunk.
+    """
+
+    def __init__(
+        self,
+        level_to_play,
+        AGENT_CONFIG,
+        num_actors,
+        chunk_size=50,
+        queue_size=8,
+        epsilon_base=0.4,
+        epsilon_alpha=7.0,
+    ):
+        self.num_actors = num_actors
+        self.resolution = AGENT_CONFIG.resolution
+        self.epsilons = [actor_epsilon(i, num_actors, epsilon_base, epsilon_alpha) for i in range(num_actors)]
+
+        # spawned, forked children can deadlock in torch's thread pools
+        ctx = mp.get_context("spawn")
+        self._stop = ctx.Event()
+        self._transitions = ctx.Queue(maxsize=queue_size)
+        ready = ctx.Queue()
+
+        # the buttons are known from the level config, without starting a game
+        n = create_doom_game(load_level_details(level_to_play)).get_available_buttons_size()
+        self.actions = [list(a) for a in it.product([0, 1], repeat=n)]
+        self.weights = SharedWeights(build_duel_qnet(AGENT_CONFIG, len(self.actions)), ctx)
+
+        self._processes = []
+        for index in range(num_actors):
+            process = ctx.Process(
+                target=_actor,
+                args=(
+                    index,
+                    level_to_play,
+                    AGENT_CONFIG,
+                    self.epsilons[index],
+                    chunk_size,
+                    self._transitions,
+                    self.weights,
+                    ready,
+                    self._stop,
+                ),
+                daemon=True,
+            )
+            process.start()
+            self._processes.append(process)
+
+        for _ in range(num_actors):
+            self._get(ready)
+        self.closed = False
+
+    def publish(self, q_net):
+        """Shares the current weights of q_net with the actors"""
+        return self.weights.publish(q_net)
+
+    def _check_actors(self):
+        for index, process in enumerate(self._processes):
+            if not process.is_alive():
+                raise RuntimeError(f"Actor {index} exited with code {process.exitcode}")
+
+    def _get(self, source):
+        while True:
+            try:
+                return source.get(timeout=1.0)
+            except queue.Empty:
+                self._check_actors()
+
+    def get(self, timeout=1.0):
+        """Next Chunk of transitions, or None if none arrived within timeout"""
+        try:
+            return self._transitions.get(timeout=timeout)
+        except queue.Empty:
+            self._check_actors()
+            return None
+
+    def close_env(self):
+        if self.closed:
+            return
+        self._stop.set()
+        for process in self._processes:
+            process.join(timeout=10)
+            if process.is_alive():
+                process.terminate()
+        self.closed = True
+        print("Actor pool closed.")
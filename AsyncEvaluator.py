@@ -0,0 +1,160 @@
+import itertools as it
+import multiprocessing as mp
+import queue
+from collections import namedtuple
+
+import numpy as np
+import torch
+
+from DoomEnv import DoomEnv
+from DuelQNet import build_duel_qnet
+from inference import InferenceQNet
+
+
+# test episodes of one q_net snapshot on one level, the snapshot taken at
+# the end of epoch, after global_step env steps
+EvalResult = namedtuple("EvalResult", ["level_name", "epoch", "global_step", "scores"])
+
+
+def _evaluator(level_name, agent_config, action_count, num_episodes, snapshots, results, ready):
+    """Plays num_episodes greedy episodes with every q_net snapshot it receives, until it receives None"""
+    torch.set_num_threads(1)
+
+    doom_env = DoomEnv(level_name, agent_config)
+    n = doom_env.get_action_space_size()
+    action_list = [list(a) for a in it.product([0, 1], repeat=n)]
+    if len(action_list) != action_count:
+        raise ValueError(f"{level_name} has {len(action_list)} actions, the q_net {action_count}")
+    q_net = build_duel_qnet(agent_config, action_count)
+    q_net.eval()
+    float_policy_net = InferenceQNet(q_net, agent_config.inference_backend)
+    ready.put(level_name)
+
+    try:
+        while True:
+            snapshot = snapshots.get()
+            if snapshot is None:
+                break
+            epoch, global_step, state_dict, int8_net = snapshot
+            q_net.load_state_dict(state_dict)
+            # the int8 policy the agent acted with, if any
+            policy_net = int8_net or float_policy_net
+
+            scores = []
+            for _ in range(num_episodes):
+                state = doom_env.reset()
+                done = False
+                while not done:
+                    action = torch.argmax(policy_net(torch.from_numpy(state[np.newaxis]))).item()
+                    state, _, done = doom_env.step(action_list[action], agent_config.frame_repeat)
+                scores.append(doom_env.episode_reward)
+
+            results.put(EvalResult(level_name, epoch, global_step, scores))
+    finally:
+        doom_env.close_env()
+
+
+class AsyncEvaluator:
+    """
+    Runs the test episodes off the training loop: one process per level of
+    level_names, each with its own DoomEnv and a CPU DuelQNet.
+
+    evaluate() hands them a snapshot of q_net, taken at an epoch boundary
+    after global_step env steps, and returns at once. The processes play
+    num_episodes greedy episodes with it (or with the int8 copy the agent
+    acts with, when given) while training goes on, and poll()
+    returns the (epoch, global_step, {level_name: mean score}) of the
+    snapshots every level has finished with, oldest first.
+    """
+
+    def __init__(self, level_names, agent_config, action_count, num_episodes):
+        self.level_names = list(level_names)
+        self.num_episodes = num_episodes
+
+        ctx = mp.get_context("spawn")
+        self._results = ctx.Queue()
+        ready = ctx.Queue()
+        self._snapshots = {}
+        self._processes = []
+        for level_name in self.level_names:
+            self._snapshots[level_name] = ctx.Queue()
+            process = ctx.Process(
+                target=_evaluator,
+                args=(
+                    level_name,
+                    agent_config,
+                    action_count,
+                    num_episodes,
+                    self._snapshots[level_name],
+                    self._results,
+                    ready,
+                ),
+                daemon=True,
+            )
+            process.start()
+            self._processes.append(process)
+
+        for _ in self.level_names:
+            self._get(ready)
+        # scores received so far of the snapshots still being evaluated
+        self._pending = {}
+        self.closed = False
+
+    def _check_evaluators(self):
+        for level_name, process in zip(self.level_names, self._processes):
+            if not process.is_alive() and process.exitcode != 0:
+                raise RuntimeError(f"Evaluator of {level_name} exited with code {process.exitcode}")
+
+    def _get(self, source, timeout=None):
+        while True:
+            try:
+                return source.get(timeout=1.0 if timeout is None else timeout)
+            except queue.Empty:
+                self._check_evaluators()
+                if timeout is not None:
+                    return None
+
+    def evaluate(self, q_net, epoch, global_step, int8_net=None):
+        """
+        Queues a snapshot of the current weights of q_net for every level, to
+        be played with int8_net, a QuantizedQNet of q_net, if given
+        """
+        state_dict = {name: tensor.detach().cpu().clone() for name, tensor in q_net.state_dict().items()}
+        self._pending[epoch] = (global_step, {})
+        for level_name in self.level_names:
+            self._snapshots[level_name].put((epoch, global_step, state_dict, int8_net))
+
+    def _outstanding(self):
+        return sum(len(self.level_names) - len(level_scores) for _, level_scores in self._pending.values())
+
+    def poll(self, wait=False):
+        """
+        (epoch, global_step, {level_name: mean score}) of the snapshots done
+        on every level, waiting for all queued snapshots if wait is set
+        """
+        while self._outstanding():
+            result = self._get(self._results) if wait else self._get(self._results, timeout=0)
+            if result is None:
+                break
+            self._pending[result.epoch][1][result.level_name] = float(np.mean(result.scores))
+
+        done = []
+        for epoch in sorted(self._pending):
+            global_step, level_scores = self._pending[epoch]
+            if len(level_scores) < len(self.level_names):
+                break
+            done.append((epoch, global_step, level_scores))
+            del self._pending[epoch]
+        return done
+
+    def close(self):
+        if self.closed:
+            return
+        for level_name in self.level_names:
+            self._snapshots[level_name].put(None)
+        for process in self._processes:
+            process.join(timeout=10)
+            if process.is_alive():
+                process.terminate()
+        self.closed = True
+        print("Evaluator closed.")
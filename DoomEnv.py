@@ -1,45 +1,94 @@
+from collections import namedtuple
+
 import vizdoom as vzd
-import json
+from level_catalog import load_level_details
 from levdoom_utils import create_doom_game
+from preprocessing import FramePreprocessor, LabelDownsampler, render_resolution_for
 
-import skimage.transform
 import numpy as np
 
 
-def load_level_details(level_name):
-    with open("levdoom_level_dict.json", "r") as f:
-        level_dict = json.load(f)
-    level_details = level_dict[level_name]
-    return level_details
+# screen buffers a DoomEnv can return besides the frame, down sampled to the
+# network resolution, and their dtype
+OBSERVATION_BUFFERS = {"depth": np.float32, "labels": np.uint8, "automap": np.float32}
 
+# everything a DoomEnv observes of a state: the processed frame (stack), the
+# game variables of the level's config as float32, in their order there, and
+# the extra buffers enabled by observation_buffers, None otherwise
+Observation = namedtuple("Observation", ["frame", "game_variables", "depth", "labels", "automap"])
 
 
+def observation_spec(state_shape, num_game_variables, buffers):
+    """(shape, dtype) of every array of an Observation with buffers enabled"""
+    spec = {
+        "frame": (tuple(state_shape), np.float32),
+        "game_variables": ((num_game_variables,), np.float32),
+    }
+    for name in buffers:
+        spec[name] = ((1, *state_shape[1:]), OBSERVATION_BUFFERS[name])
+    return spec
 
 
 class DoomEnv:
     def __init__(self, level_to_play, AGENT_CONFIG):
+        self.resolution = AGENT_CONFIG.resolution
+        # states stack the last frame_stack frames, oldest first
+        self.frame_stack = AGENT_CONFIG.frame_stack
+        self.state_shape = (self.frame_stack, *self.resolution)
+        # extra screen buffers returned in observations, see OBSERVATION_BUFFERS
+        self.buffers = tuple(AGENT_CONFIG.observation_buffers)
+        unknown = set(self.buffers) - set(OBSERVATION_BUFFERS)
+        if unknown:
+            raise ValueError(f"Unknown observation buffers {sorted(unknown)}")
+
         level_details = load_level_details(level_to_play)
         self.game = self.create_new_game(level_details)
-        self.reset()
+        self.game_variables = self.game.get_available_game_variables()
 
-        self.resolution = AGENT_CONFIG.resolution
+        screen_shape = (self.game.get_screen_height(), self.game.get_screen_width())
+        self.preprocessor = FramePreprocessor(screen_shape, self.resolution)
+        self.buffer_preprocessors = {
+            name: (LabelDownsampler if name == "labels" else FramePreprocessor)(screen_shape, self.resolution)
+            for name in self.buffers
+        }
+
+        # returned by step() in place of the next state when the episode ends,
+        # shared by all terminal transitions so it must never be written to
+        self.terminal_state = np.zeros(self.state_shape, dtype=np.float32)
+        self.terminal_state.setflags(write=False)
+        self._stack = np.zeros(self.state_shape, dtype=np.float32)
+        self.closed = False
+
+        self.reset()
 
         # self.game.init()
 
-    def preprocess(self, img):
-        """Down samples image to resolution"""
-        img = skimage.transform.resize(img, self.resolution)
-        img = img.astype(np.float32)
-        img = np.expand_dims(img, axis=0)
-        return img
+    def preprocess(self, img, out=None):
+        """Down samples image to resolution, writing into out if given"""
+        return self.preprocessor(img, out)
     
-    def step(self, action, frame_repeat):
-        
+    def step(self, action, frame_repeat, out=None, obs=None):
+        """
+        Returns (next_state, reward, done). next_state is the processed frame,
+        written into out if given, or terminal_state once the episode is over.
+
+        obs, an Observation from new_observation() or of views into shared
+        arrays, receives the game variables and extra buffers of the new
+        state, and its frame unless out is given. Once the episode is over
+        only its game variables are written, the last values of the episode.
+        """
         reward = self.game.make_action(action, frame_repeat)
         reward = self.adjust_reward(reward)
         done = self.game.is_episode_finished()
         self.episode_reward += reward
-        return reward, done
+
+        if done:
+            next_state = self.terminal_state
+            if obs is not None:
+                self.get_game_variables(obs.game_variables)
+        else:
+            next_state = self.get_processed_state(out, obs)
+        return next_state, reward, done
     
     def adjust_reward(self, reward):
         reward += 0.01
@@ -55,31 +104,75 @@ class DoomEnv:
         game.set_window_visible(False)
         game.set_mode(vzd.Mode.PLAYER)
         game.set_screen_format(vzd.ScreenFormat.GRAY8)
-        game.set_screen_resolution(vzd.ScreenResolution.RES_640X480)
+        # render directly at an integer multiple of the network resolution when
+        # ViZDoom has one, so preprocessing is a plain block average
+        game.set_screen_resolution(render_resolution_for(self.resolution))
+        # rendering the extra buffers costs time, only those asked for are
+        game.set_depth_buffer_enabled("depth" in self.buffers)
+        game.set_labels_buffer_enabled("labels" in self.buffers)
+        game.set_automap_buffer_enabled("automap" in self.buffers)
         game.init()
         print("Doom initialized.")
 
         return game
     
-    def reset(self):
+    def reset(self, out=None, obs=None):
+        """Starts a new episode and returns its first processed frame, see step for obs"""
         self.game.new_episode()
         self.episode_reward = 0
+        # frames before the start of the episode are zeros, as in the replay buffer
+        self._stack.fill(0)
         #print("Doom game reset.")
+        return self.get_processed_state(out, obs)
 
     def get_current_state(self):
         return self.game.get_state()
-    
-    def get_processed_state(self):
+
+    def new_observation(self):
+        """An Observation of zeroed arrays, for step and reset to write into"""
+        spec = observation_spec(self.state_shape, len(self.game_variables), self.buffers)
+        arrays = {name: np.zeros(shape, dtype=dtype) for name, (shape, dtype) in spec.items()}
+        return Observation(**{name: arrays.get(name) for name in Observation._fields})
+
+    def get_game_variables(self, out=None):
+        """The game variables as float32, written into out if given"""
+        if out is None:
+            out = np.empty(len(self.game_variables), dtype=np.float32)
+        # read one by one, they are still there once the episode is over,
+        # unlike the state
+        for i, variable in enumerate(self.game_variables):
+            out[i] = self.game.get_game_variable(variable)
+        return out
+
+    def get_processed_state(self, out=None, obs=None):
         state = self.get_current_state()
         if state is None:
             return None
+        if obs is not None:
+            if out is None:
+                out = obs.frame
+            self.get_game_variables(obs.game_variables)
+            for name, preprocess in self.buffer_preprocessors.items():
+                preprocess(getattr(state, name + "_buffer"), getattr(obs, name))
         img = state.screen_buffer
-        return self.preprocess(img)
+        if self.frame_stack == 1:
+            return self.preprocess(img, out)
+
+        # the oldest frame drops out of the stack
+        self._stack[:-1] = self._stack[1:]
+        self.preprocess(img, self._stack[-1:])
+        if out is None:
+            return self._stack.copy()
+        np.copyto(out, self._stack)
+        return out
     
     def get_action_space_size(self):
         n = self.game.get_available_buttons_size()
         return n
     
     def close_env(self):
+        if self.closed:
+            return
         self.game.close()
+        self.closed = True
         print("Doom game closed.")  
\ No newline at end of file
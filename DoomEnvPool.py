@@ -0,0 +1,92 @@
+from time import perf_counter
+
+from DoomEnv import DoomEnv
+
+
+class DoomEnvPool:
+    """
+    Keeps initialized DoomEnvs alive between runs instead of starting and
+    closing a game for each. acquire() hands out an idle env of the same
+    level and render settings (resolution, frame_stack and
+    observation_buffers), reset to the start of a new episode, or starts
+    one. release() returns it to the pool. At most max_idle envs are kept
+    idle, the least recently used one is closed beyond that.
+
+    ViZDoom only loads the scenario WAD in init() (setting a new one on a
+    live game hangs its next new_episode()), so each level keeps its own
+    game rather than switching WADs in place.
+    """
+
+    def __init__(self, max_idle=4):
+        self.max_idle = max_idle
+        # idle envs by key, in order of release
+        self._idle = {}
+        # key and env of every live env, idle or handed out
+        self._envs = {}
+        self.started = 0
+        self.reused = 0
+        self.startup_time = 0.0
+        self.startup_time_saved = 0.0
+        # set by close(), which may run both explicitly and from a Finalize
+        self.closed = False
+
+    @staticmethod
+    def key(level_name, agent_config):
+        return (
+            level_name,
+            tuple(agent_config.resolution),
+            agent_config.frame_stack,
+            tuple(agent_config.observation_buffers),
+        )
+
+    def acquire(self, level_name, agent_config):
+        self.closed = False
+        key = self.key(level_name, agent_config)
+        if key in self._idle:
+            doom_env = self._idle.pop(key)
+            doom_env.reset()
+            self.reused += 1
+            # what starting a game has cost on average so far
+            self.startup_time_saved += self.startup_time / self.started
+            print(f"Reusing the Doom game of {level_name}")
+            return doom_env
+
+        start = perf_counter()
+        doom_env = DoomEnv(level_name, agent_config)
+        self.startup_time += perf_counter() - start
+        self.started += 1
+        self._envs[id(doom_env)] = key, doom_env
+        return doom_env
+
+    def release(self, doom_env):
+        key, _ = self._envs[id(doom_env)]
+        if key in self._idle:
+            # a second env of the same key, keep only one
+            self._close(self._idle.pop(key))
+        self._idle[key] = doom_env
+        while len(self._idle) > self.max_idle:
+            self._close(self._idle.pop(next(iter(self._idle))))
+
+    def _close(self, doom_env):
+        del self._envs[id(doom_env)]
+        doom_env.close_env()
+
+    def report(self):
+        return "Env pool: %d games started in %.2f s, %d reused, %.2f s of startup saved" % (
+            self.started, self.startup_time, self.reused, self.startup_time_saved
+        )
+
+    def close(self):
+        """
+        Closes every env of the pool, including those not released, e.g. by a
+        run that raised. Does nothing if the pool was closed since its last
+        acquire().
+        """
+        if self.closed:
+            return
+        self.closed = True
+        for _, doom_env in list(self._envs.values()):
+            self._close(doom_env)
+        self._idle.clear()
+        if self.started:
+            print(self.report())
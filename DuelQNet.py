@@ -0,0 +1,172 @@
+import json
+import pickle
+import sys
+from types import ModuleType, SimpleNamespace
+
+import torch
+import torch.nn as nn
+
+
+def conv_output_size(size, kernel_size, stride):
+    return (size - kernel_size) // stride + 1
+
+
+class DuelQNet(nn.Module):
+    """
+    This is Duel DQN architecture.
+    see https://arxiv.org/abs/1511.06581 for more information.
+
+    A stack of conv / BatchNorm / ReLU blocks, one per entry of channels and
+    strides, over inputs of shape (in_channels, *resolution). The flattened
+    features are split in two halves feeding the state value and the action
+    advantage heads, each an MLP with hidden layers of head_sizes. The
+    defaults are the original network for 30x45 frames.
+    """
+
+    def __init__(
+        self,
+        available_actions_count,
+        resolution=(30, 45),
+        in_channels=1,
+        channels=(8, 8, 8, 16),
+        strides=(2, 2, 1, 1),
+        kernel_size=3,
+        head_sizes=(64,),
+    ):
+        super().__init__()
+        if len(channels) != len(strides):
+            raise ValueError(f"{len(channels)} conv channels given for {len(strides)} strides")
+
+        self.input_shape = (in_channels, *resolution)
+        self.depth = len(channels)
+
+        height, width = resolution
+        for i, (out_channels, stride) in enumerate(zip(channels, strides), start=1):
+            height = conv_output_size(height, kernel_size, stride)
+            width = conv_output_size(width, kernel_size, stride)
+            if height < 1 or width < 1:
+                raise ValueError(f"Resolution {tuple(resolution)} is too small for {self.depth} conv layers")
+
+            # registered as conv1, conv2, ... like the original fixed layers
+            setattr(self, f"conv{i}", nn.Sequential(
+                nn.Conv2d(in_channels, out_channels, kernel_size=kernel_size, stride=stride, bias=False),
+                nn.BatchNorm2d(out_channels),
+                nn.ReLU(),
+            ))
+            in_channels = out_channels
+
+        self.num_features = in_channels * height * width
+        self.value_features = self.num_features // 2
+
+        self.state_fc = self._head(self.value_features, head_sizes, 1)
+
+        self.advantage_fc = self._head(
+            self.num_features - self.value_features, head_sizes, available_actions_count
+        )
+
+    @staticmethod
+    def _head(in_features, head_sizes, out_features):
+        layers = []
+        for size in head_sizes:
+            layers += [nn.Linear(in_features, size), nn.ReLU()]
+            in_features = size
+        layers.append(nn.Linear(in_features, out_features))
+        return nn.Sequential(*layers)
+
+    def forward(self, x):
+        for i in range(1, self.depth + 1):
+            x = getattr(self, f"conv{i}")(x)
+        x = x.reshape(-1, self.num_features)
+        x1 = x[:, :self.value_features]  # input for the net to calculate the state value
+        x2 = x[:, self.value_features:]  # relative advantage of actions in the state
+        state_value = self.state_fc(x1).reshape(-1, 1)
+        advantage_values = self.advantage_fc(x2)
+        x = state_value + (
+            advantage_values - advantage_values.mean(dim=1).reshape(-1, 1)
+        )
+
+        return x
+
+    def __setstate__(self, state):
+        super().__setstate__(state)
+        # checkpoints pickled before the network was configurable only have
+        # the fixed conv1..conv4 layers, derive the attributes added since
+        if "depth" not in state:
+            self.depth = sum(name.startswith("conv") for name in self._modules)
+            self.value_features = self.state_fc[0].in_features
+            self.num_features = self.value_features + self.advantage_fc[0].in_features
+            self.input_shape = (self.conv1[0].in_channels, 30, 45)
+
+    def count_parameters(self):
+        return sum(p.numel() for p in self.parameters())
+
+    def count_flops(self):
+        """
+        FLOPs of a forward pass on one state, counting a multiply-add as two.
+        Only the convs and linear layers are counted, BatchNorm, ReLU and the
+        dueling sum add less than a percent.
+        """
+        flops = 0
+        height, width = self.input_shape[1:]
+        for i in range(1, self.depth + 1):
+            conv = getattr(self, f"conv{i}")[0]
+            height = conv_output_size(height, conv.kernel_size[0], conv.stride[0])
+            width = conv_output_size(width, conv.kernel_size[1], conv.stride[1])
+            flops += 2 * conv.weight.numel() * height * width
+        for module in list(self.state_fc) + list(self.advantage_fc):
+            if isinstance(module, nn.Linear):
+                flops += 2 * module.weight.numel()
+        return flops
+
+    def summary(self):
+        channels = [getattr(self, f"conv{i}")[0].out_channels for i in range(1, self.depth + 1)]
+        return "DuelQNet: input {}, convs {}, {} features, {:,} parameters, {:.3f} MFLOPs per state".format(
+            "x".join(map(str, self.input_shape)),
+            channels,
+            self.num_features,
+            self.count_parameters(),
+            self.count_flops() / 1e6,
+        )
+
+
+def build_duel_qnet(agent_config, available_actions_count):
+    """DuelQNet shaped by the network keys of an agent config"""
+    return DuelQNet(
+        available_actions_count,
+        resolution=tuple(agent_config.resolution),
+        in_channels=agent_config.frame_stack,
+        channels=tuple(agent_config.conv_channels),
+        strides=tuple(agent_config.conv_strides),
+        kernel_size=agent_config.conv_kernel_size,
+        head_sizes=tuple(agent_config.head_sizes),
+    )
+
+
+class _CheckpointUnpickler(pickle.Unpickler):
+    """Finds DuelQNet in this module whichever script pickled it, e.g. __main__ of multi_run.py"""
+
+    def find_class(self, module, name):
+        if name == "DuelQNet":
+            return DuelQNet
+        return super().find_class(module, name)
+
+
+# the pickle_module torch.load expects, for _CheckpointUnpickler
+_checkpoint_pickle = ModuleType("_checkpoint_pickle")
+_checkpoint_pickle.Unpickler = _CheckpointUnpickler
+_checkpoint_pickle.load = pickle.load
+
+
+def load_q_net(path, map_location="cpu"):
+    """DuelQNet saved whole with torch.save, as the training loops do, onto map_location"""
+    return torch.load(path, map_location=map_location, pickle_module=_checkpoint_pickle, weights_only=False)
+
+
+# prints the size and cost of the networks of the given config files, e.g.
+# python DuelQNet.py configs/dqn_basic_config.json
+if __name__ == "__main__":
+    for config_file_path in sys.argv[1:]:
+        with open(config_file_path, "r") as f:
+            config = SimpleNamespace(**json.load(f))
+        # advantage head sized for the 2 ** 4 button combinations of 4 buttons
+        print(config_file_path, build_duel_qnet(config, 2 ** 4).summary())
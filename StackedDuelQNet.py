@@ -0,0 +1,130 @@
+import torch
+import torch.nn as nn
+
+
+class StackedLinear(nn.Module):
+    """num_seeds independent linear layers applied as one batched matmul to inputs of shape (num_seeds, B, in_features)"""
+
+    def __init__(self, num_seeds, in_features, out_features):
+        super().__init__()
+        self.weight = nn.Parameter(torch.empty(num_seeds, in_features, out_features))
+        self.bias = nn.Parameter(torch.zeros(num_seeds, 1, out_features))
+
+    def forward(self, x):
+        return torch.baddbmm(self.bias, x, self.weight)
+
+
+class StackedDuelQNet(nn.Module):
+    """
+    num_seeds independent DuelQNets of the same shape evaluated as one network,
+    so a forward / backward covers every seed at once.
+
+    Each conv becomes a grouped conv with one group per seed, and BatchNorm
+    over the channels of all seeds keeps per-seed statistics. The heads are
+    batched matmuls over per-seed weights. Seed k reads channels
+    [k * in_channels, (k + 1) * in_channels) of the input, of shape
+    (B, num_seeds * in_channels, H, W), and gets row k of the output, of shape
+    (num_seeds, B, actions). Build it from DuelQNets with from_q_nets, copy a
+    seed back into a DuelQNet with export_seed.
+    """
+
+    def __init__(self, num_seeds, template):
+        super().__init__()
+        self.num_seeds = num_seeds
+        self.depth = template.depth
+        self.in_channels = template.input_shape[0]
+        self.num_features = template.num_features
+        self.value_features = template.value_features
+
+        for i in range(1, self.depth + 1):
+            conv = getattr(template, f"conv{i}")[0]
+            setattr(self, f"conv{i}", nn.Sequential(
+                nn.Conv2d(
+                    num_seeds * conv.in_channels,
+                    num_seeds * conv.out_channels,
+                    kernel_size=conv.kernel_size,
+                    stride=conv.stride,
+                    groups=num_seeds,
+                    bias=False,
+                ),
+                nn.BatchNorm2d(num_seeds * conv.out_channels),
+                nn.ReLU(),
+            ))
+
+        self.state_fc = self._stacked_head(template.state_fc)
+        self.advantage_fc = self._stacked_head(template.advantage_fc)
+
+    def _stacked_head(self, head):
+        return nn.Sequential(*[
+            StackedLinear(self.num_seeds, layer.in_features, layer.out_features)
+            if isinstance(layer, nn.Linear) else nn.ReLU()
+            for layer in head
+        ])
+
+    @classmethod
+    def from_q_nets(cls, q_nets):
+        stacked = cls(len(q_nets), q_nets[0])
+        for seed, q_net in enumerate(q_nets):
+            stacked.load_seed(seed, q_net)
+        return stacked.to(next(q_nets[0].parameters()).device)
+
+    def _seed_pairs(self, q_net):
+        """(stacked tensor, name, DuelQNet tensor) for every conv and BatchNorm tensor of the convs"""
+        for i in range(1, self.depth + 1):
+            stacked_block = getattr(self, f"conv{i}")
+            block = getattr(q_net, f"conv{i}")
+            for name, tensor in block.state_dict(keep_vars=True).items():
+                yield stacked_block.state_dict(keep_vars=True)[name], name, tensor
+
+    @torch.no_grad()
+    def load_seed(self, seed, q_net):
+        """Copies the weights and BatchNorm statistics of a DuelQNet into seed"""
+        for stacked, name, tensor in self._seed_pairs(q_net):
+            if name.endswith("num_batches_tracked"):
+                stacked.copy_(tensor)
+            else:
+                n = tensor.shape[0]
+                stacked[seed * n:(seed + 1) * n].copy_(tensor)
+        for stacked_head, head in ((self.state_fc, q_net.state_fc), (self.advantage_fc, q_net.advantage_fc)):
+            for stacked, layer in zip(stacked_head, head):
+                if isinstance(layer, nn.Linear):
+                    stacked.weight[seed].copy_(layer.weight.T)
+                    stacked.bias[seed, 0].copy_(layer.bias)
+
+    @torch.no_grad()
+    def export_seed(self, seed, q_net):
+        """Copies seed into a DuelQNet of the same shape and returns it"""
+        for stacked, name, tensor in self._seed_pairs(q_net):
+            if name.endswith("num_batches_tracked"):
+                tensor.copy_(stacked)
+            else:
+                n = tensor.shape[0]
+                tensor.copy_(stacked[seed * n:(seed + 1) * n])
+        for stacked_head, head in ((self.state_fc, q_net.state_fc), (self.advantage_fc, q_net.advantage_fc)):
+            for stacked, layer in zip(stacked_head, head):
+                if isinstance(layer, nn.Linear):
+                    layer.weight.copy_(stacked.weight[seed].T)
+                    layer.bias.copy_(stacked.bias[seed, 0])
+        return q_net
+
+    def forward(self, x):
+        for i in range(1, self.depth + 1):
+            x = getattr(self, f"conv{i}")(x)
+        # (B, seeds * C, h, w) -> (seeds, B, C * h * w), the per-seed flatten order of DuelQNet
+        x = x.reshape(x.shape[0], self.num_seeds, self.num_features).transpose(0, 1)
+        state_value = self.state_fc(x[:, :, :self.value_features])
+        advantage_values = self.advantage_fc(x[:, :, self.value_features:])
+        return state_value + advantage_values - advantage_values.mean(dim=2, keepdim=True)
+
+
+def stack_states(states, channels_last=False):
+    """
+    Per-seed batches of shape (seeds, B, C, H, W) as one stacked input of
+    shape (B, seeds * C, H, W), in the channels_last memory format if set
+    """
+    if channels_last:
+        # laid out as (B, H, W, seeds * C) by the one copy of the reshape
+        num_seeds, batch_size, channels, height, width = states.shape
+        stacked = states.permute(1, 3, 4, 0, 2).reshape(batch_size, height, width, num_seeds * channels)
+        return stacked.permute(0, 3, 1, 2)
+    return states.transpose(0, 1).flatten(1, 2)
@@ -0,0 +1,83 @@
+import itertools as it
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from DoomEnv import Observation, observation_spec
+
+
+class ThreadedDoomEnv:
+    """
+    Steps one DoomEnv on a background thread, behind the batched interface of
+    VecDoomEnv with a single env in a single group: step_async() returns at
+    once and step_wait() waits for the step. ViZDoom releases the GIL while
+    the game simulates, so the caller can run inference and train steps in
+    the meantime. Finished episodes are reset automatically.
+
+    The arrays returned by reset() and step(), and those of observation, are
+    overwritten by the next call, copy them if they need to be kept. doom_env
+    stays open, it belongs to the caller (e.g. the DoomEnvPool of multi_run).
+    """
+
+    def __init__(self, doom_env, frame_repeat):
+        self.doom_env = doom_env
+        self.frame_repeat = frame_repeat
+        self.num_envs = 1
+        self.groups = [slice(0, 1)]
+        self.state_shape = doom_env.state_shape
+        n = doom_env.get_action_space_size()
+        self.actions = [list(a) for a in it.product([0, 1], repeat=n)]
+
+        # the arrays of an Observation with a batch dimension of one env
+        spec = observation_spec(self.state_shape, len(doom_env.game_variables), doom_env.buffers)
+        self.observation = Observation(**{
+            name: np.zeros((1, *spec[name][0]), dtype=spec[name][1]) if name in spec else None
+            for name in Observation._fields
+        })
+        self.obs = self.observation.frame
+        self.game_variables = self.observation.game_variables
+        self._env_obs = Observation(*(None if array is None else array[0] for array in self.observation))
+        self.rewards = np.zeros(1, dtype=np.float32)
+        self.dones = np.zeros(1, dtype=np.bool_)
+        self.final_episode_rewards = np.zeros(1, dtype=np.float32)
+
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="doom-step")
+        self._pending = None
+
+    def _step(self, action):
+        _, reward, done = self.doom_env.step(self.actions[action], self.frame_repeat, obs=self._env_obs)
+        self.rewards[0] = reward
+        self.dones[0] = done
+        if done:
+            # the next observation is the first frame of the new episode
+            self.final_episode_rewards[0] = self.doom_env.episode_reward
+            self.doom_env.reset(obs=self._env_obs)
+
+    def reset(self):
+        self.doom_env.reset(obs=self._env_obs)
+        self.rewards[0] = 0
+        self.dones[0] = False
+        return self.obs
+
+    def step_async(self, actions, group=None):
+        self._pending = self._executor.submit(self._step, int(actions[0]))
+
+    def step_wait(self, group=None):
+        pending, self._pending = self._pending, None
+        # raises what the step raised
+        pending.result()
+        return self.obs, self.rewards, self.dones
+
+    def step(self, actions):
+        self.step_async(actions)
+        return self.step_wait()
+
+    def get_action_space_size(self):
+        return self.doom_env.get_action_space_size()
+
+    def close(self):
+        """Stops the stepping thread, without closing doom_env"""
+        if self._pending is not None:
+            self._pending.result()
+            self._pending = None
+        self._executor.shutdown()
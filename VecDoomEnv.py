@@ -0,0 +1,205 @@
+import itertools as it
+import multiprocessing as mp
+
+import numpy as np
+
+from DoomEnv import DoomEnv, Observation, observation_spec
+from level_catalog import load_level_details
+from levdoom_utils import create_doom_game
+
+
+# Single byte commands exchanged over the worker pipes. Everything else
+# (actions, observations, rewards, dones) goes through shared memory, so
+# nothing is pickled once the workers are running.
+_STEP = b"s"
+_RESET = b"r"
+_CLOSE = b"c"
+_DONE = b"k"
+
+
+class _SharedBuffers:
+    """Shared-memory arrays holding the state of all N workers"""
+
+    def __init__(self, ctx, num_envs, spec):
+        self.num_envs = num_envs
+        # (shape, dtype) of each Observation array of one env, see observation_spec
+        self.spec = spec
+
+        self.raw_observation = {
+            name: ctx.RawArray("B", num_envs * int(np.prod(shape)) * np.dtype(dtype).itemsize)
+            for name, (shape, dtype) in spec.items()
+        }
+        self.raw_rewards = ctx.RawArray("f", num_envs)
+        self.raw_dones = ctx.RawArray("B", num_envs)
+        self.raw_episode_rewards = ctx.RawArray("f", num_envs)
+        self.raw_actions = ctx.RawArray("q", num_envs)
+        self.raw_action_space = ctx.RawArray("q", num_envs)
+
+    def views(self):
+        observation = {
+            name: np.frombuffer(raw, dtype=self.spec[name][1]).reshape((self.num_envs,) + self.spec[name][0])
+            for name, raw in self.raw_observation.items()
+        }
+        observation = Observation(**{name: observation.get(name) for name in Observation._fields})
+        rewards = np.frombuffer(self.raw_rewards, dtype=np.float32)
+        dones = np.frombuffer(self.raw_dones, dtype=np.bool_)
+        episode_rewards = np.frombuffer(self.raw_episode_rewards, dtype=np.float32)
+        actions = np.frombuffer(self.raw_actions, dtype=np.int64)
+        action_space = np.frombuffer(self.raw_action_space, dtype=np.int64)
+        return observation, rewards, dones, episode_rewards, actions, action_space
+
+
+def _worker(index, level_name, agent_config, frame_repeat, shared, conn):
+    """Owns one DoomEnv and steps it on command from the parent process"""
+    observation, rewards, dones, episode_rewards, actions, action_space = shared.views()
+    # this env's rows of the shared arrays, written in place by the env
+    obs = Observation(*(None if array is None else array[index] for array in observation))
+
+    doom_env = DoomEnv(level_name, agent_config)
+    n = doom_env.get_action_space_size()
+    action_list = [list(a) for a in it.product([0, 1], repeat=n)]
+    action_space[index] = n
+
+    doom_env.reset(obs=obs)
+    conn.send_bytes(_DONE)
+
+    try:
+        while True:
+            cmd = conn.recv_bytes()
+
+            if cmd == _STEP:
+                _, reward, done = doom_env.step(action_list[actions[index]], frame_repeat, obs=obs)
+                rewards[index] = reward
+                dones[index] = done
+                if done:
+                    # auto-reset, the next observation is the first frame of
+                    # the new episode
+                    episode_rewards[index] = doom_env.episode_reward
+                    doom_env.reset(obs=obs)
+
+            elif cmd == _RESET:
+                doom_env.reset(obs=obs)
+                rewards[index] = 0
+                dones[index] = False
+
+            elif cmd == _CLOSE:
+                break
+
+            conn.send_bytes(_DONE)
+    finally:
+        doom_env.close_env()
+        conn.close()
+
+
+class VecDoomEnv:
+    """
+    Runs num_envs DoomEnv instances in worker processes and steps them as a batch.
+    Finished episodes are reset automatically by the workers.
+
+    The arrays returned by reset() and step() are views into shared memory,
+    they are overwritten by the next call, copy them if they need to be kept.
+    So are the other arrays of the envs' Observations in observation, e.g.
+    game_variables, of shape (num_envs, num_game_variables).
+
+    The envs are split into num_groups contiguous groups which can be stepped
+    on their own with step_async(actions, group) and step_wait(group), so one
+    group simulates while the caller works on the observations of another.
+    """
+
+    def __init__(self, level_to_play, AGENT_CONFIG, num_envs, frame_repeat, start_method=None, num_groups=1):
+        self.num_envs = num_envs
+        if not 1 <= num_groups <= num_envs:
+            raise ValueError(f"Cannot split {num_envs} envs into {num_groups} groups")
+        # env indices of each group, as slices of the shared arrays
+        bounds = np.linspace(0, num_envs, num_groups + 1).astype(int)
+        self.groups = [slice(start, stop) for start, stop in zip(bounds[:-1], bounds[1:])]
+        self.frame_repeat = frame_repeat
+        self.resolution = AGENT_CONFIG.resolution
+        self.state_shape = (AGENT_CONFIG.frame_stack, *self.resolution)
+        # read from the level's config, without starting a game
+        num_game_variables = create_doom_game(load_level_details(level_to_play)).get_available_game_variables_size()
+        spec = observation_spec(self.state_shape, num_game_variables, AGENT_CONFIG.observation_buffers)
+
+        ctx = mp.get_context(start_method)
+        self._shared = _SharedBuffers(ctx, num_envs, spec)
+        (
+            self.observation,
+            self.rewards,
+            self.dones,
+            self.final_episode_rewards,
+            self._actions,
+            self._action_space,
+        ) = self._shared.views()
+        self.obs = self.observation.frame
+        self.game_variables = self.observation.game_variables
+
+        self._conns = []
+        self._processes = []
+        for index in range(num_envs):
+            parent_conn, child_conn = ctx.Pipe()
+            process = ctx.Process(
+                target=_worker,
+                args=(index, level_to_play, AGENT_CONFIG, frame_repeat, self._shared, child_conn),
+                daemon=True,
+            )
+            process.start()
+            child_conn.close()
+            self._conns.append(parent_conn)
+            self._processes.append(process)
+
+        self._wait()
+        n = int(self._action_space[0])
+        self.actions = [list(a) for a in it.product([0, 1], repeat=n)]
+        # groups with a step in flight
+        self._waiting = set()
+        self.closed = False
+
+    def _send(self, cmd, envs=slice(None)):
+        for conn in self._conns[envs]:
+            conn.send_bytes(cmd)
+
+    def _wait(self, envs=slice(None)):
+        for conn in self._conns[envs]:
+            conn.recv_bytes()
+
+    def reset(self):
+        self._send(_RESET)
+        self._wait()
+        return self.obs
+
+    def step_async(self, actions, group=None):
+        """Starts stepping the envs of group, all of them if None, with one action index each"""
+        groups = range(len(self.groups)) if group is None else [group]
+        envs = slice(None) if group is None else self.groups[group]
+        self._actions[envs] = actions
+        self._send(_STEP, envs)
+        self._waiting.update(groups)
+
+    def step_wait(self, group=None):
+        """Waits for the step of group, all groups if None, and returns its (obs, rewards, dones)"""
+        groups = range(len(self.groups)) if group is None else [group]
+        envs = slice(None) if group is None else self.groups[group]
+        self._wait(envs)
+        self._waiting.difference_update(groups)
+        return self.obs[envs], self.rewards[envs], self.dones[envs]
+
+    def step(self, actions):
+        """Steps all envs with one action index each, returns (obs, rewards, dones)"""
+        self.step_async(actions)
+        return self.step_wait()
+
+    def get_action_space_size(self):
+        return int(self._action_space[0])
+
+    def close_env(self):
+        if self.closed:
+            return
+        for group in self._waiting:
+            self._wait(self.groups[group])
+        self._send(_CLOSE)
+        for process in self._processes:
+            process.join()
+        for conn in self._conns:
+            conn.close()
+        self.closed = True
+        print("Doom env pool closed.")
@@ -0,0 +1,60 @@
+"""
+Wall time of a series of short runs that each start a DoomEnv, play a few
+steps and close it, against the same runs taking their env from a
+DoomEnvPool, which starts each level's game once.
+
+Run from the repository root:
+    python -m benchmarks.bench_env_pool --runs 10 --levels SeekAndSlayLevel0-v0 SeekAndSlayLevel1_1-v0
+"""
+import argparse
+from time import perf_counter
+from types import SimpleNamespace
+
+import numpy as np
+
+from DoomEnv import DoomEnv
+from DoomEnvPool import DoomEnvPool
+
+
+def short_run(doom_env, steps, frame_repeat=12):
+    n = doom_env.get_action_space_size()
+    rng = np.random.default_rng(0)
+    doom_env.reset()
+    for _ in range(steps):
+        _, _, done = doom_env.step(list(rng.integers(0, 2, size=n)), frame_repeat)
+        if done:
+            doom_env.reset()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--steps", type=int, default=20)
+    parser.add_argument("--levels", nargs="+", default=["SeekAndSlayLevel0-v0", "SeekAndSlayLevel1_1-v0"])
+    args = parser.parse_args()
+
+    config = SimpleNamespace(resolution=[30, 45], frame_stack=1, observation_buffers=[])
+    levels = [args.levels[i % len(args.levels)] for i in range(args.runs)]
+
+    start = perf_counter()
+    for level_name in levels:
+        doom_env = DoomEnv(level_name, config)
+        short_run(doom_env, args.steps)
+        doom_env.close_env()
+    fresh = perf_counter() - start
+
+    pool = DoomEnvPool()
+    start = perf_counter()
+    for level_name in levels:
+        doom_env = pool.acquire(level_name, config)
+        short_run(doom_env, args.steps)
+        pool.release(doom_env)
+    pooled = perf_counter() - start
+    pool.close()
+
+    print(f"{args.runs} runs of {args.steps} steps on {len(args.levels)} levels: "
+          f"fresh envs {fresh:.2f} s, pooled envs {pooled:.2f} s ({fresh / pooled:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Latency of DuelQNet action selection with each InferenceQNet backend, against
+the eager train-mode forward the agent used before.
+
+Run from the repository root:
+    python -m benchmarks.bench_inference --batch-sizes 1 8 --threads 1
+"""
+import argparse
+from time import perf_counter
+
+import torch
+
+from DuelQNet import DuelQNet
+from inference import INFERENCE_BACKENDS, InferenceQNet
+
+
+def time_per_call(fn, states, repeats):
+    for _ in range(20):
+        fn(states)
+    start = perf_counter()
+    for _ in range(repeats):
+        fn(states)
+    return (perf_counter() - start) / repeats
+
+
+def trained_q_net(action_count, resolution):
+    """DuelQNet after a few SGD steps, so its BatchNorm statistics are not the identity"""
+    q_net = DuelQNet(action_count, resolution=resolution)
+    opt = torch.optim.SGD(q_net.parameters(), lr=1e-3)
+    for _ in range(10):
+        opt.zero_grad()
+        q_net(torch.rand(64, 1, *resolution)).mean().backward()
+        opt.step()
+    return q_net
+
+
+def eager_train_mode(q_net):
+    def forward(states):
+        with torch.no_grad():
+            return q_net(states)
+    return forward
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8])
+    parser.add_argument("--resolution", type=int, nargs=2, default=[30, 45])
+    parser.add_argument("--actions", type=int, default=16)
+    parser.add_argument("--threads", type=int, default=1)
+    parser.add_argument("--repeats", type=int, default=2000)
+    args = parser.parse_args()
+
+    torch.set_num_threads(args.threads)
+    q_net = trained_q_net(args.actions, args.resolution)
+
+    for batch_size in args.batch_sizes:
+        states = torch.rand(batch_size, 1, *args.resolution)
+        q_net.train()
+        baseline = time_per_call(eager_train_mode(q_net), states, args.repeats)
+        print(f"\nbatch {batch_size}: eager train mode (previous path) {baseline * 1e6:.0f} us/call")
+
+        # train mode forwards update the BatchNorm statistics, take the
+        # reference once they are done
+        q_net.eval()
+        with torch.no_grad():
+            reference = q_net(states)
+        for backend in INFERENCE_BACKENDS:
+            inference_net = InferenceQNet(q_net, backend)
+            t = time_per_call(inference_net, states, args.repeats)
+            error = (inference_net(states) - reference).abs().max().item()
+            print(f"  {backend:8s} {t * 1e6:7.0f} us/call   speedup {baseline / t:4.1f}x   "
+                  f"max abs diff to eval mode {error:.1e}")
+
+    # cost of following the online net, paid once per weight update
+    inference_net = InferenceQNet(q_net, "script")
+    start = perf_counter()
+    for _ in range(args.repeats):
+        inference_net.fused.load_from(q_net)
+    print(f"\nrefolding the weights: {(perf_counter() - start) / args.repeats * 1e6:.0f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Env steps per second of the sequential training loops (run_training and
+run_vec_training) against run_pipelined_training with policy_lag 0 and 1,
+on one env and on a VecDoomEnv pool, with the policy lag and share of time
+spent waiting for the envs it measures.
+
+Run from the repository root:
+    python -m benchmarks.bench_pipeline --steps 1000 --num-envs 4
+"""
+import argparse
+import itertools as it
+from time import perf_counter
+from types import SimpleNamespace
+
+import multi_run
+from multi_run import AGENT_CONFIG, create_agent
+from DoomEnv import DoomEnv
+from ThreadedDoomEnv import ThreadedDoomEnv
+from VecDoomEnv import VecDoomEnv
+
+
+def timed(loop, *args, **kwargs):
+    """Runs one epoch of a training loop, returns its wall time and last wandb log"""
+    logs = []
+    start = perf_counter()
+    loop(SimpleNamespace(log=logs.append), None, *args, num_epochs=1, save_model=False, **kwargs)
+    return perf_counter() - start, logs[-1]
+
+
+def report(name, steps, elapsed, log):
+    pipeline = ""
+    if "policy_lag" in log:
+        pipeline = ", %.0f%% waiting for the envs, policy lag %.2f" % (100 * log["env_wait_fraction"], log["policy_lag"])
+    return f"{name:<28} {steps / elapsed:7.1f} env steps/s{pipeline}"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--level", default="SeekAndSlayLevel0-v0")
+    parser.add_argument("--steps", type=int, default=1000)
+    parser.add_argument("--num-envs", type=int, default=4)
+    args = parser.parse_args()
+
+    # no test episodes, they would be timed too
+    AGENT_CONFIG.async_eval = False
+    results = []
+
+    doom_env = DoomEnv(args.level, AGENT_CONFIG)
+    actions = [list(a) for a in it.product([0, 1], repeat=doom_env.get_action_space_size())]
+    n = len(actions)
+
+    agent = create_agent(AGENT_CONFIG, n, None)
+    elapsed, log = timed(multi_run.run_training, doom_env, agent, actions,
+                         frame_repeat=AGENT_CONFIG.frame_repeat, steps_per_epoch=args.steps)
+    results.append(report("1 env, sequential", args.steps, elapsed, log))
+
+    for policy_lag in (0, 1):
+        threaded_env = ThreadedDoomEnv(doom_env, AGENT_CONFIG.frame_repeat)
+        agent = create_agent(AGENT_CONFIG, n, None)
+        elapsed, log = timed(multi_run.run_pipelined_training, threaded_env, agent,
+                             steps_per_epoch=args.steps, policy_lag=policy_lag)
+        threaded_env.close()
+        results.append(report(f"1 env, pipelined, lag {policy_lag}", args.steps, elapsed, log))
+    doom_env.close_env()
+
+    if args.num_envs > 1:
+        vec_env = VecDoomEnv(args.level, AGENT_CONFIG, args.num_envs, AGENT_CONFIG.frame_repeat)
+        agent = create_agent(AGENT_CONFIG, n, None, num_streams=args.num_envs)
+        elapsed, log = timed(multi_run.run_vec_training, vec_env, agent, steps_per_epoch=args.steps)
+        vec_env.close_env()
+        results.append(report(f"{args.num_envs} envs, sequential", args.steps, elapsed, log))
+
+        for policy_lag in (0, 1):
+            vec_env = VecDoomEnv(args.level, AGENT_CONFIG, args.num_envs, AGENT_CONFIG.frame_repeat, num_groups=2)
+            agent = create_agent(AGENT_CONFIG, n, None, num_streams=args.num_envs)
+            elapsed, log = timed(multi_run.run_pipelined_training, vec_env, agent,
+                                 steps_per_epoch=args.steps, policy_lag=policy_lag)
+            vec_env.close_env()
+            results.append(report(f"{args.num_envs} envs, pipelined, lag {policy_lag}", args.steps, elapsed, log))
+
+    print()
+    print("\n".join(results))
+
+
+if __name__ == "__main__":
+    main()
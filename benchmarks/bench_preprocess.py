@@ -0,0 +1,107 @@
+"""
+Compares FramePreprocessor against the skimage.transform.resize preprocessing
+it replaced, on frames recorded from a live level.
+
+Run from the repository root:
+    python -m benchmarks.bench_preprocess --resolution 30 45
+"""
+import argparse
+import random
+from time import perf_counter
+
+import numpy as np
+import skimage.transform
+import vizdoom as vzd
+
+from level_catalog import load_level_details
+from levdoom_utils import create_doom_game
+from preprocessing import FramePreprocessor, native_resolution_for
+
+
+def record_frames(level_name, screen_resolution, nb_frames, seed=0):
+    """Plays random actions with a fixed seed, so equal seeds give equal trajectories"""
+    game = create_doom_game(load_level_details(level_name))
+    game.set_window_visible(False)
+    game.set_mode(vzd.Mode.PLAYER)
+    game.set_screen_format(vzd.ScreenFormat.GRAY8)
+    game.set_screen_resolution(screen_resolution)
+    game.set_seed(seed)
+    game.init()
+
+    rng = random.Random(seed)
+    n = game.get_available_buttons_size()
+    frames = []
+    game.new_episode()
+    while len(frames) < nb_frames:
+        if game.is_episode_finished():
+            game.new_episode()
+        frames.append(game.get_state().screen_buffer.copy())
+        game.make_action([rng.randint(0, 1) for _ in range(n)], 4)
+    game.close()
+    return frames
+
+
+def skimage_preprocess(img, resolution):
+    img = skimage.transform.resize(img, resolution)
+    img = img.astype(np.float32)
+    img = np.expand_dims(img, axis=0)
+    return img
+
+
+def time_per_call(fn, frames, repeats):
+    start = perf_counter()
+    for i in range(repeats):
+        fn(frames[i % len(frames)])
+    return (perf_counter() - start) / repeats
+
+
+def report(name, reference_frames, frames, resolution, repeats):
+    preprocessor = FramePreprocessor(frames[0].shape, resolution)
+    out = np.empty((1,) + tuple(resolution), dtype=np.float32)
+
+    errors = np.array([
+        np.abs(skimage_preprocess(ref, resolution) - preprocessor(img)).mean()
+        for ref, img in zip(reference_frames, frames)
+    ])
+    max_error = max(
+        np.abs(skimage_preprocess(ref, resolution) - preprocessor(img)).max()
+        for ref, img in zip(reference_frames, frames)
+    )
+
+    t_skimage = time_per_call(lambda img: skimage_preprocess(img, resolution), reference_frames, repeats // 10)
+    t_fast = time_per_call(lambda img: preprocessor(img, out), frames, repeats)
+
+    print(f"\n{name}: {reference_frames[0].shape[::-1]} -> skimage vs {frames[0].shape[::-1]} -> "
+          f"{'block average' if preprocessor.block else 'resize matrices'}, target {tuple(resolution)}")
+    print(f"  mean abs error: {errors.mean():.2e}   max abs error: {max_error:.2e}")
+    print(f"  skimage: {t_skimage * 1e3:.3f} ms/frame   FramePreprocessor: {t_fast * 1e3:.3f} ms/frame"
+          f"   speedup: {t_skimage / t_fast:.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--level", default="SeekAndSlayLevel0-v0")
+    parser.add_argument("--resolution", type=int, nargs=2, default=[30, 45])
+    parser.add_argument("--integer-resolution", type=int, nargs=2, default=[30, 40])
+    parser.add_argument("--frames", type=int, default=100)
+    parser.add_argument("--repeats", type=int, default=2000)
+    args = parser.parse_args()
+
+    frames_640 = record_frames(args.level, vzd.ScreenResolution.RES_640X480, args.frames)
+
+    # same 640x480 render as the current DoomEnv
+    report("640x480 render", frames_640, frames_640, args.resolution, args.repeats)
+
+    # smaller native render at an integer ratio, compared with skimage on the
+    # 640x480 render of the same (seeded) trajectory
+    native = native_resolution_for(args.integer_resolution)
+    if native is None:
+        print(f"\nno integer-ratio ViZDoom resolution for {tuple(args.integer_resolution)}")
+        return
+    screen_resolution = getattr(vzd.ScreenResolution, "RES_%dX%d" % native)
+    native_frames = record_frames(args.level, screen_resolution, args.frames)
+    report("native %dx%d render" % native, frames_640, native_frames, args.integer_resolution, args.repeats)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""
+Latency and greedy-action agreement of the int8 QuantizedQNet against the
+float32 acting paths, for a DuelQNet trained a few steps on random frames.
+
+Run from the repository root:
+    python -m benchmarks.bench_quantization --batch-sizes 1 8 --threads 1
+"""
+import argparse
+
+import torch
+
+from benchmarks.bench_inference import time_per_call, trained_q_net
+from inference import InferenceQNet
+from quantization import QuantizedQNet
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8])
+    parser.add_argument("--resolution", type=int, nargs=2, default=[30, 45])
+    parser.add_argument("--actions", type=int, default=16)
+    parser.add_argument("--threads", type=int, default=1)
+    parser.add_argument("--calibration-states", type=int, default=1024)
+    parser.add_argument("--engine", default=None)
+    parser.add_argument("--repeats", type=int, default=2000)
+    args = parser.parse_args()
+
+    torch.set_num_threads(args.threads)
+    q_net = trained_q_net(args.actions, args.resolution)
+    q_net.eval()
+
+    calibration = torch.rand(args.calibration_states, 1, *args.resolution)
+    quantized = QuantizedQNet(q_net, calibration, engine=args.engine)
+    agreement, max_diff = quantized.agreement(q_net, torch.rand(args.calibration_states, 1, *args.resolution))
+    print(f"int8 ({quantized.engine}): greedy-action agreement {agreement:.1%}, max abs Q difference {max_diff:.3f}")
+
+    for batch_size in args.batch_sizes:
+        states = torch.rand(batch_size, 1, *args.resolution)
+        print(f"\nbatch {batch_size}:")
+        for name, net in (
+            ("eager", InferenceQNet(q_net, "eager")),
+            ("script", InferenceQNet(q_net, "script")),
+            ("int8", quantized),
+        ):
+            print(f"  {name:6s} {time_per_call(net, states, args.repeats) * 1e6:7.0f} us/call")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Train steps per second of K seeds trained as K separate DQNAgents against one
+StackedDQNAgent holding the K seeds, on replay buffers filled with random
+transitions, and greedy acting steps per second for one state per seed. A
+stacked step updates (or acts for) every seed, so the rates compare one step
+of all K seeds.
+
+Run from the repository root:
+    python -m benchmarks.bench_stacked_seeds --seeds 3 8
+"""
+import argparse
+
+import numpy as np
+
+from benchmarks.bench_train_step import filled_agent, steps_per_sec
+from multi_run import AGENT_CONFIG, DEVICE, StackedDQNAgent
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seeds", type=int, nargs="+", default=[3, 8])
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--actions", type=int, default=16)
+    parser.add_argument("--capacity", type=int, default=2000)
+    parser.add_argument("--repeats", type=int, default=100)
+    args = parser.parse_args()
+
+    print(f"device: {DEVICE}")
+    for num_seeds in args.seeds:
+        agents = [filled_agent(args.batch_size, args.actions, args.capacity) for _ in range(num_seeds)]
+
+        def separate_step():
+            for agent in agents:
+                agent.train()
+
+        separate = steps_per_sec(separate_step, args.repeats)
+
+        stacked_agent = StackedDQNAgent(
+            args.actions,
+            [agent.memory for agent in agents],
+            batch_size=args.batch_size,
+            discount_factor=AGENT_CONFIG.discount_factor,
+            lr=AGENT_CONFIG.learning_rate,
+        )
+        stacked = steps_per_sec(stacked_agent.train, args.repeats)
+        print(f"{num_seeds} seeds, train: separate agents {separate:7.1f} steps/s   "
+              f"stacked {stacked:7.1f} steps/s ({stacked / separate:.2f}x)")
+
+        states = np.random.default_rng(0).random((num_seeds, *agents[0].memory.state_shape), dtype=np.float32)
+        for agent in (*agents, stacked_agent):
+            agent.epsilon = 0
+
+        def separate_act():
+            for agent, state in zip(agents, states):
+                agent.get_actions(state[np.newaxis])
+
+        separate = steps_per_sec(separate_act, 10 * args.repeats)
+        stacked = steps_per_sec(lambda: stacked_agent.get_actions(states), 10 * args.repeats)
+        print(f"{num_seeds} seeds, act:   separate agents {separate:7.1f} steps/s   "
+              f"stacked {stacked:7.1f} steps/s ({stacked / separate:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Train steps per second of DQNAgent.train, with separate and concatenated
+q_net forwards, against the previous train step which computed the double-Q
+targets through NumPy, on a replay buffer filled with random transitions.
+
+Run from the repository root:
+    python -m benchmarks.bench_train_step --batch-sizes 32 64 128 256
+"""
+import argparse
+from time import perf_counter
+
+import numpy as np
+import torch
+
+from multi_run import AGENT_CONFIG, DEVICE, DQNAgent
+from replay_buffer import create_replay_buffer
+
+
+def previous_train_step(agent):
+    """DQNAgent.train as it was before the targets moved to the torch side"""
+    states, actions, rewards, next_states, dones = agent.sample_batch()[:5]
+    not_dones = ~dones
+
+    row_idx = np.arange(agent.batch_size)
+
+    with torch.no_grad():
+        idx = row_idx, np.argmax(agent.q_net(next_states).cpu().data.numpy(), 1)
+        next_state_values = agent.target_net(next_states).cpu().data.numpy()[idx]
+        next_state_values = torch.from_numpy(next_state_values).to(DEVICE)
+
+    q_targets = rewards + agent.discount * next_state_values * not_dones
+    action_values = agent.q_net(states)[row_idx, actions]
+
+    agent.opt.zero_grad()
+    loss = agent.criterion(q_targets, action_values)
+    loss.backward()
+    agent.opt.step()
+
+
+def filled_agent(batch_size, action_count, capacity, concat_forward=False):
+    memory = create_replay_buffer(
+        "transitions", capacity, (AGENT_CONFIG.frame_stack, *AGENT_CONFIG.resolution), device=DEVICE
+    )
+    rng = np.random.default_rng(0)
+    state_shape = (AGENT_CONFIG.frame_stack, *AGENT_CONFIG.resolution)
+    for _ in range(capacity):
+        memory.append(
+            rng.random(state_shape, dtype=np.float32),
+            rng.integers(action_count),
+            rng.normal(),
+            rng.random(state_shape, dtype=np.float32),
+            rng.random() < 0.05,
+        )
+    return DQNAgent(
+        action_count,
+        memory,
+        batch_size=batch_size,
+        discount_factor=AGENT_CONFIG.discount_factor,
+        lr=AGENT_CONFIG.learning_rate,
+        load_model=False,
+        concat_forward=concat_forward,
+    )
+
+
+def steps_per_sec(step, repeats):
+    for _ in range(5):
+        step()
+    if DEVICE.type == "cuda":
+        torch.cuda.synchronize()
+    start = perf_counter()
+    for _ in range(repeats):
+        step()
+    if DEVICE.type == "cuda":
+        torch.cuda.synchronize()
+    return repeats / (perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[32, 64, 128, 256])
+    parser.add_argument("--actions", type=int, default=16)
+    parser.add_argument("--capacity", type=int, default=2000)
+    parser.add_argument("--repeats", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"device: {DEVICE}")
+    for batch_size in args.batch_sizes:
+        agent = filled_agent(batch_size, args.actions, args.capacity)
+        before = steps_per_sec(lambda: previous_train_step(agent), args.repeats)
+        separate = steps_per_sec(agent.train, args.repeats)
+        agent = filled_agent(batch_size, args.actions, args.capacity, concat_forward=True)
+        concat = steps_per_sec(agent.train, args.repeats)
+        print(f"batch {batch_size:4d}: previous {before:7.1f} steps/s   "
+              f"separate forwards {separate:7.1f} steps/s ({separate / before:.2f}x)   "
+              f"concatenated forward {concat:7.1f} steps/s ({concat / before:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Checks the states and next states FrameReplayBuffer rebuilds from its
+frames against the ones appended, over random episodes (some cut short
+without a done, as at an epoch boundary) that wrap the buffer many times.
+Frames older than the oldest stored one may only be zeroed, never taken
+from another episode.
+
+Run from the repository root:
+    python -m benchmarks.check_frame_replay --capacity 6 --frame-stack 2 4
+"""
+import argparse
+
+import numpy as np
+
+from replay_buffer import FrameReplayBuffer
+
+
+def check_stack(rebuilt, expected, what):
+    """rebuilt must be expected with at most a prefix of its frames zeroed"""
+    kept = rebuilt != 0
+    if not (rebuilt[kept] == expected[kept]).all() or (kept[:-1] > kept[1:]).any():
+        raise AssertionError(f"{what}: rebuilt {rebuilt.tolist()}, appended {expected.tolist()}")
+
+
+def run_check(capacity, frame_stack, num_steps, seed):
+    rng = np.random.default_rng(seed)
+    buffer = FrameReplayBuffer(capacity, (frame_stack, 1, 1), frame_stack=frame_stack)
+    # slot -> (state, next_state, done) of the transition it holds, as frame ids
+    appended = {}
+    frame_id = 0
+    stack = None
+
+    for step in range(num_steps):
+        if stack is None:
+            frame_id = frame_id % 250 + 1
+            stack = np.zeros(frame_stack, dtype=np.int64)
+            stack[-1] = frame_id
+        frame_id = frame_id % 250 + 1
+        next_stack = np.append(stack[1:], frame_id)
+        done = rng.random() < 0.25
+
+        index = buffer.append(
+            stack.reshape(-1, 1, 1) / 255.0, 0, 0.0, next_stack.reshape(-1, 1, 1) / 255.0, done
+        )
+        for slot in buffer.invalidated:
+            appended.pop(slot, None)
+        appended[index] = stack, next_stack, done
+
+        # episodes end with a done, or are cut short now and then
+        stack = None if done or rng.random() < 0.05 else next_stack
+
+        slots = np.flatnonzero(buffer.valid[:buffer.size])
+        states, _, _, next_states, dones = buffer.gather_arrays(slots)[:5]
+        for slot, state, next_state, rebuilt_done in zip(slots, states, next_states, dones):
+            expected_state, expected_next, expected_done = appended[slot]
+            what = f"step {step}, slot {slot}"
+            check_stack(state.ravel().astype(np.int64), expected_state, what + " state")
+            assert rebuilt_done == expected_done, what
+            if expected_done:
+                assert not next_state.any(), what + " terminal next state"
+            else:
+                check_stack(next_state.ravel().astype(np.int64), expected_next, what + " next state")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--capacity", type=int, nargs="+", default=[6, 7, 32])
+    parser.add_argument("--frame-stack", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--steps", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    for capacity in args.capacity:
+        for frame_stack in args.frame_stack:
+            run_check(capacity, frame_stack, args.steps, args.seed)
+            print(f"capacity {capacity}, frame_stack {frame_stack}: ok over {args.steps} appends")
+
+
+if __name__ == "__main__":
+    main()
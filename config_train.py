@@ -10,7 +10,6 @@ from collections import deque
 from time import sleep, time
 
 import numpy as np
-import skimage.transform
 import torch
 import torch.nn as nn
 import torch.optim as optim
@@ -19,6 +18,7 @@ from tqdm import trange
 import vizdoom as vzd
 
 from levdoom_utils import create_doom_game
+from preprocessing import FramePreprocessor
 
 import wandb
 import json
@@ -46,12 +46,18 @@ else:
 CONFIG = load_config("configs/dqn_basic_config.json")
 
 
+# the game below renders at 640x480
+preprocessor = FramePreprocessor((480, 640), CONFIG.resolution)
+
+
 def preprocess(img):
     """Down samples image to resolution"""
-    img = skimage.transform.resize(img, CONFIG.resolution)
-    img = img.astype(np.float32)
-    img = np.expand_dims(img, axis=0)
-    return img
+    return preprocessor(img)
+
+
+# next_state of every terminal transition, must never be written to
+terminal_state = np.zeros((1, *CONFIG.resolution), dtype=np.float32)
+terminal_state.setflags(write=False)
 
 
 def create_simple_game(levdoom_level_details):
@@ -105,12 +111,12 @@ def run(game, agent, actions, num_epochs, frame_repeat, steps_per_epoch=2000):
 
     for epoch in range(num_epochs):
         game.new_episode()
+        state = preprocess(game.get_state().screen_buffer)
         train_scores = []
         global_step = 0
         print(f"\nEpoch #{epoch + 1}")
 
         for _ in trange(steps_per_epoch, leave=False):
-            state = preprocess(game.get_state().screen_buffer)
             action = agent.get_action(state)
             reward = game.make_action(actions[action], frame_repeat)
             done = game.is_episode_finished()
@@ -118,7 +124,7 @@ def run(game, agent, actions, num_epochs, frame_repeat, steps_per_epoch=2000):
             if not done:
                 next_state = preprocess(game.get_state().screen_buffer)
             else:
-                next_state = np.zeros((1, 30, 45)).astype(np.float32)
+                next_state = terminal_state
 
             agent.append_memory(state, action, reward, next_state, done)
 
@@ -128,6 +134,9 @@ def run(game, agent, actions, num_epochs, frame_repeat, steps_per_epoch=2000):
             if done:
                 train_scores.append(game.get_total_reward())
                 game.new_episode()
+                state = preprocess(game.get_state().screen_buffer)
+            else:
+                state = next_state
 
             global_step += 1
 
@@ -0,0 +1,166 @@
+"""
+Cross-level evaluation of training checkpoints: greedy test episodes of
+every checkpoint on every selected LevDoom level, run over a process pool,
+written out as a checkpoint x level matrix of mean scores.
+
+Each (checkpoint, level) result is cached under the sha256 of the
+checkpoint file, the level and the eval settings, so re-running after
+adding a checkpoint only evaluates the new one. E.g.
+
+    python eval_matrix.py model_checkpoints/*/model.pth --modes seek_and_slay --difficulties 0 1
+"""
+import argparse
+import hashlib
+import itertools as it
+import json
+import multiprocessing as mp
+from multiprocessing.util import Finalize
+import os
+from types import SimpleNamespace
+
+import numpy as np
+import torch
+
+from DoomEnvPool import DoomEnvPool
+from DuelQNet import load_q_net
+from inference import InferenceQNet
+from level_catalog import load_catalog
+
+
+def checkpoint_hash(path):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def cache_path(cache_dir, checkpoint_digest, level_name, eval_config):
+    config_digest = hashlib.sha256(json.dumps(eval_config, sort_keys=True).encode()).hexdigest()[:16]
+    return os.path.join(cache_dir, checkpoint_digest[:16], f"{level_name}-{config_digest}.json")
+
+
+# the env of the last level evaluated by this worker, kept for the next task
+_env_pool = DoomEnvPool(max_idle=1)
+
+
+def _init_worker():
+    torch.set_num_threads(1)
+    # run when the pool shuts the worker down, so no game outlives it
+    Finalize(_env_pool, _env_pool.close, exitpriority=10)
+
+
+def _evaluate(task):
+    """Plays the test episodes of one (checkpoint, level) pair and returns its result"""
+    checkpoint, level_name, eval_config = task
+    try:
+        q_net = load_q_net(checkpoint)
+        q_net.eval()
+        policy_net = InferenceQNet(q_net, "fused")
+        # states shaped for the checkpoint's input
+        input_shape = q_net.input_shape
+        env_config = SimpleNamespace(
+            resolution=list(input_shape[1:]), frame_stack=input_shape[0], observation_buffers=[]
+        )
+        doom_env = _env_pool.acquire(level_name, env_config)
+
+        try:
+            n = doom_env.get_action_space_size()
+            actions = [list(a) for a in it.product([0, 1], repeat=n)]
+            action_count = q_net.advantage_fc[-1].out_features
+            if len(actions) != action_count:
+                # a level of another mode, with other buttons
+                return task, {"error": f"{level_name} has {len(actions)} actions, the checkpoint {action_count}"}
+
+            scores = []
+            for _ in range(eval_config["episodes"]):
+                state = doom_env.reset()
+                done = False
+                while not done:
+                    action = torch.argmax(policy_net(torch.from_numpy(state[np.newaxis]))).item()
+                    state, _, done = doom_env.step(actions[action], eval_config["frame_repeat"])
+                scores.append(doom_env.episode_reward)
+            return task, {"mean": float(np.mean(scores)), "std": float(np.std(scores)), "scores": scores}
+        finally:
+            _env_pool.release(doom_env)
+    except Exception as e:
+        # not cached, the pair is evaluated again on the next run
+        return task, {"error": repr(e), "transient": True}
+
+
+def evaluate_matrix(checkpoints, level_names, eval_config, out_dir, processes=None):
+    """
+    Results of every (checkpoint, level) pair as {checkpoint: {level_name: result}},
+    from the cache in out_dir or evaluated over a pool of processes workers
+    """
+    cache_dir = os.path.join(out_dir, "cache")
+    digests = {checkpoint: checkpoint_hash(checkpoint) for checkpoint in checkpoints}
+    results = {checkpoint: {} for checkpoint in checkpoints}
+
+    tasks = []
+    # level-major, so the workers mostly reuse the env of their last task
+    for level_name in level_names:
+        for checkpoint in checkpoints:
+            path = cache_path(cache_dir, digests[checkpoint], level_name, eval_config)
+            if os.path.exists(path):
+                with open(path, "r") as f:
+                    results[checkpoint][level_name] = json.load(f)
+            else:
+                tasks.append((checkpoint, level_name, eval_config))
+
+    print(f"{len(checkpoints) * len(level_names) - len(tasks)} cached results, {len(tasks)} pairs to evaluate")
+    if tasks:
+        # spawned, forked children can deadlock in torch's thread pools
+        pool = mp.get_context("spawn").Pool(processes, initializer=_init_worker)
+        try:
+            for done, ((checkpoint, level_name, _), result) in enumerate(pool.imap_unordered(_evaluate, tasks), 1):
+                results[checkpoint][level_name] = result
+                print(f"[{done}/{len(tasks)}] {checkpoint} on {level_name}:",
+                      result.get("error") or "%.1f +/- %.1f" % (result["mean"], result["std"]))
+                if not result.get("transient"):
+                    path = cache_path(cache_dir, digests[checkpoint], level_name, eval_config)
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    with open(path, "w") as f:
+                        json.dump(result, f)
+        finally:
+            pool.close()
+            pool.join()
+    return results
+
+
+def write_matrix(results, level_names, eval_config, out_dir):
+    """Writes the mean scores as matrix.csv, one row per checkpoint, and everything as matrix.json"""
+    with open(os.path.join(out_dir, "matrix.json"), "w") as f:
+        json.dump({"eval_config": eval_config, "levels": level_names, "results": results}, f, indent=4)
+
+    with open(os.path.join(out_dir, "matrix.csv"), "w") as f:
+        f.write(",".join(["checkpoint"] + level_names) + "\n")
+        for checkpoint, level_results in results.items():
+            means = ["%.2f" % level_results[level]["mean"] if "mean" in level_results[level] else ""
+                     for level in level_names]
+            f.write(",".join([checkpoint] + means) + "\n")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("checkpoints", nargs="+")
+    parser.add_argument("--modes", nargs="+", default=None)
+    parser.add_argument("--difficulties", type=int, nargs="+", default=None)
+    parser.add_argument("--episodes", type=int, default=5)
+    parser.add_argument("--frame-repeat", type=int, default=12)
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--out-dir", default="eval_results")
+    args = parser.parse_args()
+
+    catalog = load_catalog()
+    level_names = catalog.select(args.modes, args.difficulties)
+    skipped = set(catalog.select(args.modes, args.difficulties, available_only=False)) - set(level_names)
+    if skipped:
+        print(f"Skipping {len(skipped)} levels whose WAD files are missing:", sorted(skipped))
+    eval_config = {"episodes": args.episodes, "frame_repeat": args.frame_repeat}
+    os.makedirs(args.out_dir, exist_ok=True)
+
+    results = evaluate_matrix(args.checkpoints, level_names, eval_config, args.out_dir, args.processes)
+    write_matrix(results, level_names, eval_config, args.out_dir)
+    print(f"Results of {len(args.checkpoints)} checkpoints on {len(level_names)} levels in {args.out_dir}")
+
+
+if __name__ == "__main__":
+    main()
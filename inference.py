@@ -0,0 +1,134 @@
+import copy
+import warnings
+
+import torch
+import torch.nn as nn
+
+
+INFERENCE_BACKENDS = ("eager", "fused", "script", "compile")
+
+
+def fold_batch_norm(conv, bn):
+    """Weight and bias of a single conv computing conv followed by bn in eval mode"""
+    scale = bn.weight / torch.sqrt(bn.running_var + bn.eps)
+    weight = conv.weight * scale.reshape(-1, 1, 1, 1)
+    bias = bn.bias - bn.running_mean * scale
+    if conv.bias is not None:
+        bias = bias + conv.bias * scale
+    return weight, bias
+
+
+class FusedDuelQNet(nn.Module):
+    """
+    Eval-mode copy of a DuelQNet with every conv / BatchNorm pair folded into
+    one conv with a bias. load_from() refreshes it from the DuelQNet in place,
+    so compiled or scripted versions of it keep working after a refresh.
+    """
+
+    def __init__(self, q_net):
+        super().__init__()
+        layers = []
+        for i in range(1, q_net.depth + 1):
+            conv = getattr(q_net, f"conv{i}")[0]
+            layers += [
+                nn.Conv2d(conv.in_channels, conv.out_channels, conv.kernel_size, conv.stride),
+                nn.ReLU(),
+            ]
+        self.convs = nn.Sequential(*layers)
+        self.state_fc = copy.deepcopy(q_net.state_fc)
+        self.advantage_fc = copy.deepcopy(q_net.advantage_fc)
+        self.num_features = q_net.num_features
+        self.value_features = q_net.value_features
+        self.to(next(q_net.parameters()).device)
+        self.eval()
+        self.requires_grad_(False)
+        self.load_from(q_net)
+
+    @torch.no_grad()
+    def load_from(self, q_net):
+        for i in range(1, q_net.depth + 1):
+            conv, bn = getattr(q_net, f"conv{i}")[:2]
+            weight, bias = fold_batch_norm(conv, bn)
+            fused = self.convs[2 * (i - 1)]
+            fused.weight.copy_(weight)
+            fused.bias.copy_(bias)
+        for fused, layer in zip(
+            list(self.state_fc) + list(self.advantage_fc), list(q_net.state_fc) + list(q_net.advantage_fc)
+        ):
+            if isinstance(layer, nn.Linear):
+                fused.weight.copy_(layer.weight)
+                fused.bias.copy_(layer.bias)
+
+    def forward(self, x):
+        x = self.convs(x).reshape(-1, self.num_features)
+        state_value = self.state_fc(x[:, :self.value_features])
+        advantage_values = self.advantage_fc(x[:, self.value_features:])
+        return state_value + advantage_values - advantage_values.mean(dim=1, keepdim=True)
+
+
+class InferenceQNet:
+    """
+    Q values of a DuelQNet for acting, with one of INFERENCE_BACKENDS:
+      eager   - q_net itself under no_grad, in eval mode for the call
+      fused   - FusedDuelQNet under inference_mode
+      script  - FusedDuelQNet through TorchScript
+      compile - FusedDuelQNet through torch.compile
+
+    With auto_refresh the fused backends follow q_net: before each call the
+    version counters of its parameters and buffers, bumped by optimizer
+    steps, load_state_dict and in-place copies, are compared with those of
+    the last fold, and the folded weights are refreshed if any changed. That
+    suits a q_net that changes now and then (weights published to an actor
+    or evaluator). A refold costs about three forwards of a single state, so
+    a q_net updated between every two calls is better refreshed explicitly
+    with refresh() every few updates, the Q values lagging q_net until then.
+    """
+
+    def __init__(self, q_net, backend="script", auto_refresh=True):
+        if backend not in INFERENCE_BACKENDS:
+            raise ValueError(f"Unknown inference backend {backend}, expected one of {INFERENCE_BACKENDS}")
+        self.q_net = q_net
+        self.backend = backend
+        self.auto_refresh = auto_refresh
+        if backend == "eager":
+            return
+
+        self.fused = FusedDuelQNet(q_net)
+        if backend == "script":
+            with warnings.catch_warnings():
+                # still the fastest of the backends for a network this small on CPU
+                warnings.simplefilter("ignore", FutureWarning)
+                self._forward = torch.jit.script(self.fused)
+        elif backend == "compile":
+            self._forward = torch.compile(self.fused)
+        else:
+            self._forward = self.fused
+        self._tensors = list(q_net.parameters()) + list(q_net.buffers())
+        self._versions = [t._version for t in self._tensors]
+
+    def refresh(self):
+        """Refolds the weights if q_net changed since the last refresh"""
+        if self.backend == "eager":
+            return
+        versions = [t._version for t in self._tensors]
+        if versions != self._versions:
+            self.fused.load_from(self.q_net)
+            self._versions = versions
+
+    def __call__(self, states):
+        if self.backend == "eager":
+            # BatchNorm in eval mode, as folded by the other backends: with
+            # batch statistics one env's action would depend on the states
+            # of the others, and acting would update the running stats
+            training = self.q_net.training
+            self.q_net.eval()
+            try:
+                with torch.no_grad():
+                    return self.q_net(states)
+            finally:
+                self.q_net.train(training)
+
+        if self.auto_refresh:
+            self.refresh()
+        with torch.inference_mode():
+            return self._forward(states)
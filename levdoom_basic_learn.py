@@ -10,7 +10,6 @@ from collections import deque
 from time import sleep, time
 
 import numpy as np
-import skimage.transform
 import torch
 import torch.nn as nn
 import torch.optim as optim
@@ -19,6 +18,7 @@ from tqdm import trange
 import vizdoom as vzd
 
 from levdoom_utils import create_doom_game
+from preprocessing import FramePreprocessor
 
 import wandb
 
@@ -60,12 +60,13 @@ else:
     print("Using CPU")
 
 
+# the game below renders at 640x480
+preprocessor = FramePreprocessor((480, 640), resolution)
+
+
 def preprocess(img):
     """Down samples image to resolution"""
-    img = skimage.transform.resize(img, resolution)
-    img = img.astype(np.float32)
-    img = np.expand_dims(img, axis=0)
-    return img
+    return preprocessor(img)
 
 
 def create_simple_game(levdoom_level_details):
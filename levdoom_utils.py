@@ -1,18 +1,12 @@
-from levdoom_level_dictionary import LEVDOOM_LEVEL_DICTIONARY
+from level_catalog import load_catalog
 import vizdoom as vzd
 
 def load_level_files(level_to_play):
-    mode = level_to_play["mode"]
-    difficulty = level_to_play["difficulty"]
-    level_name = level_to_play["level_name"]
-
-    level_wad_file = f"levdoom_levels/{mode}/" + LEVDOOM_LEVEL_DICTIONARY[mode][difficulty][level_name] + ".wad"
-    # want to be able to specify different config files for different modes, not one per mode
-    conf_file = f"levdoom_levels/{mode}/conf.cfg"
+    level = load_catalog()[level_to_play["level_name"]]
 
     return {
-        "wad_file": level_wad_file,
-        "conf_file": conf_file
+        "wad_file": level.wad_file,
+        "conf_file": level.conf_file
     }
 
 def create_doom_game(lvl_details):
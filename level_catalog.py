@@ -0,0 +1,96 @@
+import functools
+import json
+import os
+from collections import namedtuple
+
+
+# paths are resolved against the repository, whatever the working directory
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+LEVEL_DICT_PATH = os.path.join(ROOT_DIR, "levdoom_level_dict.json")
+LEVELS_DIR = os.path.join(ROOT_DIR, "levdoom_levels")
+
+# one LevDoom level, with the absolute paths of its WAD and of the config of
+# its mode, and whether both exist
+Level = namedtuple("Level", ["level_name", "mode", "difficulty", "wad_file", "conf_file", "available"])
+
+
+class LevelCatalog:
+    """
+    The LevDoom levels of a level dict (levdoom_level_dict.json, generated by
+    convert_level_dict.py), indexed by name and by mode and difficulty. The
+    WAD and config files of every level are checked once, when the catalog
+    is built, so a missing level fails before any game is started.
+    """
+
+    def __init__(self, level_dict, levels_dir=LEVELS_DIR):
+        self.details = level_dict
+        self.levels = {}
+        for level_name, details in level_dict.items():
+            mode = details["mode"]
+            wad_file = os.path.join(levels_dir, mode, details["level_wad_file"] + ".wad")
+            # want to be able to specify different config files for different modes, not one per mode
+            conf_file = os.path.join(levels_dir, mode, "conf.cfg")
+            self.levels[level_name] = Level(
+                level_name,
+                mode,
+                details["difficulty"],
+                wad_file,
+                conf_file,
+                os.path.isfile(wad_file) and os.path.isfile(conf_file),
+            )
+
+        self.by_mode = {}
+        for level in self.levels.values():
+            self.by_mode.setdefault(level.mode, {}).setdefault(level.difficulty, []).append(level.level_name)
+
+    def __contains__(self, level_name):
+        return level_name in self.levels
+
+    def __getitem__(self, level_name):
+        """The Level of level_name, raising if it is unknown or its files are missing"""
+        if level_name not in self.levels:
+            raise KeyError(f"Unknown level {level_name}")
+        level = self.levels[level_name]
+        if not level.available:
+            missing = [path for path in (level.wad_file, level.conf_file) if not os.path.isfile(path)]
+            raise FileNotFoundError(f"Level {level_name} is missing {', '.join(missing)}")
+        return level
+
+    def select(self, modes=None, difficulties=None, available_only=True):
+        """Names of the levels in any of modes and difficulties, all of them if None"""
+        return [
+            level.level_name
+            for level in self.levels.values()
+            if (modes is None or level.mode in modes)
+            and (difficulties is None or level.difficulty in difficulties)
+            and (level.available or not available_only)
+        ]
+
+    def missing(self):
+        """Names of the catalogued levels whose files are missing"""
+        return [level.level_name for level in self.levels.values() if not level.available]
+
+
+@functools.lru_cache(maxsize=None)
+def load_catalog(path=LEVEL_DICT_PATH, levels_dir=LEVELS_DIR):
+    """The LevelCatalog of a level dict file, read and checked once per process"""
+    with open(path, "r") as f:
+        return LevelCatalog(json.load(f), levels_dir)
+
+
+def load_level_details(level_name):
+    """The level dict entry of level_name, after checking that the level can be played"""
+    catalog = load_catalog()
+    catalog[level_name]  # raises if it is unknown or its files are missing
+    return catalog.details[level_name]
+
+
+# lists the catalogued levels and whether they can be played, e.g.
+# python level_catalog.py
+if __name__ == "__main__":
+    catalog = load_catalog()
+    for mode, difficulties in catalog.by_mode.items():
+        for difficulty, level_names in sorted(difficulties.items()):
+            available = [name for name in level_names if catalog.levels[name].available]
+            print(f"{mode} {difficulty}: {len(available)}/{len(level_names)} available", available)
+    print(f"{len(catalog.levels) - len(catalog.missing())} of {len(catalog.levels)} levels available")
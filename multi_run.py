@@ -2,27 +2,33 @@ import json
 import torch
 import wandb
 
+import contextlib
 import itertools as it
 import os
-import random
-from collections import deque
+import shutil
+import threading
 from time import sleep, time
 
 import numpy as np
-import skimage.transform
 import torch.nn as nn
 import torch.optim as optim
 from tqdm import trange
 import datetime
-
-from DoomEnv import DoomEnv
-
-def load_level_details(level_name):
-    with open("levdoom_level_dict.json", "r") as f:
-        level_dict = json.load(f)
-    level_details = level_dict[level_name]
-    return level_details
-
+from multiprocessing.util import Finalize
+
+from DoomEnvPool import DoomEnvPool
+from level_catalog import load_level_details
+from VecDoomEnv import VecDoomEnv
+from ThreadedDoomEnv import ThreadedDoomEnv
+from DuelQNet import build_duel_qnet, load_q_net
+from StackedDuelQNet import StackedDuelQNet, stack_states
+from ActorPool import ActorPool
+from AsyncEvaluator import AsyncEvaluator
+from run_scheduler import RunScheduler
+from inference import InferenceQNet
+from quantization import QuantizedQNet, replay_states
+from replay_buffer import PrioritizedReplayBuffer, create_replay_buffer, open_replay_buffer
+from prefetch import BatchPrefetcher
 
 class DictObj:
     def __init__(self, in_dict: dict):
@@ -48,6 +54,12 @@ level_details = load_level_details(level_name)
 
 NB_RUNS = 3
 
+# initialized games kept for the next runs of this process, the workers of
+# a RunScheduler run one run after the other. Finalize closes them when the
+# process exits, worker or not
+ENV_POOL = DoomEnvPool()
+Finalize(ENV_POOL, ENV_POOL.close, exitpriority=10)
+
 
 # Uses GPU if available
 if torch.cuda.is_available():
@@ -60,46 +72,136 @@ else:
 
 
 
-def test(game, agent, actions, base_reward_per_step=0.01):
-    """Runs a test_episodes_per_epoch episodes and prints the result"""
-    print("\nTesting...")
-    test_scores = []
-    for test_episode in trange(AGENT_CONFIG.test_episodes_per_epoch, leave=False):
-        game.new_episode()
-        episode_reward = 0
-        while not game.is_episode_finished():
-            state = preprocess(game.get_state().screen_buffer)
-            best_action_index = agent.get_action(state)
+def print_train_scores(train_scores, label="Results"):
+    """
+    Prints the mean, std, min and max of the scores of the episodes finished
+    during an epoch and returns their mean, NaN if none finished (short
+    epochs, or steps split over many envs)
+    """
+    if len(train_scores) == 0:
+        print(f"{label}: no episode finished")
+        return float("nan")
+    train_scores = np.array(train_scores)
+    print(
+        "{}: mean: {:.1f} +/- {:.1f},".format(label, train_scores.mean(), train_scores.std()),
+        "min: %.1f," % train_scores.min(),
+        "max: %.1f," % train_scores.max(),
+    )
+    return float(train_scores.mean())
 
-            reward = game.make_action(actions[best_action_index], AGENT_CONFIG.frame_repeat)
-            reward += base_reward_per_step
-            episode_reward += reward
 
-        #r = game.get_total_reward()
-        r = episode_reward
-        test_scores.append(r)
+class EpochEnd:
+    """
+    End of epoch bookkeeping shared by the training loops of a run: target
+    net update, int8 requantization, results, test episodes of the
+    evaluator, wandb log, checkpoint, replay flush and epoch_callback.
+    close() waits for the last test scores and returns the mean train score
+    of each epoch.
+    """
+
+    def __init__(self, wandb_run, save_path, evaluator=None, int8_acting=False, save_model=True, epoch_callback=None, label="Results"):
+        self.wandb_run = wandb_run
+        self.save_path = save_path
+        self.evaluator = evaluator
+        self.int8_acting = int8_acting
+        self.save_model = save_model
+        self.epoch_callback = epoch_callback
+        self.label = label
+        self.start_time = time()
+        self.epoch_scores = []
+
+    def __call__(self, agent, epoch, env_steps, train_scores, metrics=None):
+        """
+        Ends epoch (counted from 0) of a DQNAgent, after env_steps env steps
+        in total. metrics are logged along. Returns True if training should stop.
+        """
+        agent.update_target_net()
+        metrics = dict(metrics or {})
+        if self.int8_acting:
+            metrics.update(agent.quantize_policy())
+        # the test episodes play with the int8 policy the agent acts with
+        int8_net = agent.policy_net if self.int8_acting else None
+        if self.log(epoch, env_steps, train_scores, agent.q_net, agent.memory, agent.memory_lock, metrics, int8_net):
+            print("Training stopped after %d epochs" % (epoch + 1))
+            return True
+        return False
+
+    def log(self, epoch, env_steps, train_scores, q_net, memory, memory_lock=None, metrics=None, int8_net=None):
+        """
+        Everything __call__ does after updating the agent, for q_net and its
+        replay memory, int8_net being the QuantizedQNet acting for it if any.
+        Returns what epoch_callback returned.
+        """
+        self.epoch_scores.append(print_train_scores(train_scores, self.label))
+
+        if self.evaluator is not None:
+            self.evaluator.evaluate(q_net, epoch + 1, env_steps, int8_net)
+            log_evaluations(self.wandb_run, self.evaluator)
+
+        self.wandb_run.log(
+            {
+                "train_score": self.epoch_scores[-1],
+                # logged by log_evaluations with an evaluator
+                **({"test_score": -5} if self.evaluator is None else {}),
+                "global_step": env_steps,
+                **(metrics or {}),
+            }
+        )
+
+        if self.save_model:
+            torch.save(q_net, self.save_path + "/model.pth")
+        # no-op unless the replay memory is on disk
+        with memory_lock or contextlib.nullcontext():
+            memory.flush()
+
+        print("Total elapsed time: %.2f minutes" % ((time() - self.start_time) / 60.0))
+
+        return self.epoch_callback is not None and bool(self.epoch_callback(epoch + 1, self.epoch_scores[-1]))
+
+    def close(self, agent=None):
+        """Logs the last test scores, closes the evaluator and agent and returns the epoch scores"""
+        if self.evaluator is not None:
+            log_evaluations(self.wandb_run, self.evaluator, wait=True)
+            self.evaluator.close()
+        if agent is not None:
+            agent.close()
+        return self.epoch_scores
+
+
+def train_for_steps(agent, updates_due, num_steps, update_to_data_ratio):
+    """
+    Runs the train steps due after num_steps more env steps at
+    update_to_data_ratio train steps per env step, updates_due being the
+    fraction of a train step left over by the previous call. Returns the
+    fraction left over by this one.
+    """
+    updates_due += update_to_data_ratio * num_steps
+    while updates_due >= 1:
+        agent.train()
+        updates_due -= 1
+    return updates_due
 
-    test_scores = np.array(test_scores)
-    print(
-        "Results: mean: {:.1f} +/- {:.1f},".format(
-            test_scores.mean(), test_scores.std()
-        ),
-        "min: %.1f" % test_scores.min(),
-        "max: %.1f" % test_scores.max(),
-    )
-    return test_scores.mean()
 
-def run_training(wandb_run, save_path, doom_env, agent, actions, num_epochs, frame_repeat, steps_per_epoch=2000, base_reward_per_step=0.01):
+def run_training(wandb_run, save_path, doom_env, agent, actions, num_epochs, frame_repeat, steps_per_epoch=2000, base_reward_per_step=0.01, epoch_callback=None, evaluator=None, int8_acting=False, save_model=True, update_to_data_ratio=1.0):
     """
     Run num epochs of training episodes.
     Skip frame_repeat number of frames after each action.
+    After each epoch epoch_callback, if given, is called with the number of
+    epochs done and their mean train score, training stops early if it
+    returns True. With an AsyncEvaluator the test episodes of each epoch run
+    in its processes while training goes on. With int8_acting the agent acts
+    through an int8 snapshot of q_net, requantized after each epoch. The agent
+    trains update_to_data_ratio times per env step (epsilon decays once per
+    train step). Returns the mean train score of each epoch.
     """
 
-    start_time = time()
+    epoch_end = EpochEnd(wandb_run, save_path, evaluator, int8_acting, save_model, epoch_callback)
+    env_steps = 0
+    updates_due = 0.0
 
     for epoch in range(num_epochs):
 
-        doom_env.reset()
+        state = doom_env.reset()
 
         train_scores = []
         global_step = 0
@@ -109,117 +211,380 @@ def run_training(wandb_run, save_path, doom_env, agent, actions, num_epochs, fra
 
         for _ in trange(steps_per_epoch, leave=False):
 
-            state = doom_env.get_processed_state()
-
             action = agent.get_action(state)
-            reward, done = doom_env.step(actions[action], frame_repeat)
-
-            if not done:
-                next_state = doom_env.get_processed_state()
-            else:
-                next_state = np.zeros((1, 30, 45)).astype(np.float32)
+            # next_state is doom_env.terminal_state when the episode is over
+            next_state, reward, done = doom_env.step(actions[action], frame_repeat)
 
             agent.append_memory(state, action, reward, next_state, done)
 
             if global_step > agent.batch_size:
-                agent.train()
+                updates_due = train_for_steps(agent, updates_due, 1, update_to_data_ratio)
             if done:
                 #train_scores.append(game.get_total_reward())
                 train_scores.append(doom_env.episode_reward)
-                doom_env.reset()
+                state = doom_env.reset()
+            else:
+                state = next_state
 
             global_step += 1
 
-        agent.update_target_net()
-        train_scores = np.array(train_scores)
+        env_steps += global_step
+        if epoch_end(agent, epoch, env_steps, train_scores):
+            break
 
+    return epoch_end.close(agent)
+
+def run_vec_training(wandb_run, save_path, vec_env, agent, num_epochs, steps_per_epoch=2000, epoch_callback=None, evaluator=None, int8_acting=False, save_model=True, update_to_data_ratio=1.0):
+    """
+    Same as run_training, but steps a VecDoomEnv pool of envs as a batch.
+    steps_per_epoch counts env steps summed over all envs of the pool. Each
+    batched step of the num_envs envs is followed by
+    update_to_data_ratio * num_envs train steps, so runs with different
+    num_envs train as often per env step as run_training does.
+    """
+
+    epoch_end = EpochEnd(wandb_run, save_path, evaluator, int8_acting, save_model, epoch_callback)
+    env_steps = 0
+    updates_due = 0.0
+    num_envs = vec_env.num_envs
+    terminal_state = np.zeros(vec_env.state_shape, dtype=np.float32)
+    terminal_state.setflags(write=False)
+
+    for epoch in range(num_epochs):
+
+        # arrays returned by the pool live in shared memory, keep a copy of
+        # the current states since the next step overwrites them
+        states = vec_env.reset().copy()
+
+        train_scores = []
+        global_step = 0
+        print(f"\nEpoch #{epoch + 1}")
+
+        for _ in trange(steps_per_epoch // num_envs, leave=False):
+
+            actions = agent.get_actions(states)
+            next_states, rewards, dones = vec_env.step(actions)
+
+            for i in range(num_envs):
+                # the replay buffer copies the frames, no need to copy them here
+                next_state = terminal_state if dones[i] else next_states[i]
+                agent.append_memory(states[i], actions[i], rewards[i], next_state, dones[i], stream=i)
+
+                if dones[i]:
+                    train_scores.append(vec_env.final_episode_rewards[i])
+
+            if global_step > agent.batch_size:
+                updates_due = train_for_steps(agent, updates_due, num_envs, update_to_data_ratio)
+
+            states = next_states.copy()
+            global_step += num_envs
+
+        env_steps += global_step
+        if epoch_end(agent, epoch, env_steps, train_scores):
+            break
+
+    return epoch_end.close(agent)
+
+
+def run_pipelined_training(wandb_run, save_path, vec_env, agent, num_epochs, steps_per_epoch=2000, policy_lag=1, epoch_callback=None, evaluator=None, int8_acting=False, save_model=True, update_to_data_ratio=1.0):
+    """
+    Same as run_vec_training, but the envs simulate their next step while the
+    agent picks actions and trains. vec_env is a VecDoomEnv split into groups,
+    or a ThreadedDoomEnv for a single env.
+
+    With policy_lag 1, each group is started again as soon as its step is
+    appended and the train steps run while every group simulates: the
+    transitions are appended update_to_data_ratio * num_envs train steps
+    after their actions were chosen. With policy_lag 0, the train steps run
+    once every step is done and only the inference of a group overlaps the
+    simulation of the groups started before it. The measured policy lag, the
+    train steps between the weights an action was chosen with and appending
+    its transition (policy_refresh_interval adds to it with the fused
+    inference backends), is logged each epoch with the share of the time
+    spent waiting for the envs.
+    """
+    if policy_lag not in (0, 1):
+        raise ValueError(f"policy_lag must be 0 or 1, not {policy_lag}")
+
+    epoch_end = EpochEnd(wandb_run, save_path, evaluator, int8_acting, save_model, epoch_callback)
+    env_steps = 0
+    updates_due = 0.0
+    num_envs = vec_env.num_envs
+    groups = vec_env.groups
+    terminal_state = np.zeros(vec_env.state_shape, dtype=np.float32)
+    terminal_state.setflags(write=False)
+    actions = np.zeros(num_envs, dtype=np.int64)
+    # agent.policy_updates when the actions of each group were chosen
+    versions = np.zeros(len(groups), dtype=np.int64)
+
+    for epoch in range(num_epochs):
+
+        states = vec_env.reset().copy()
+
+        train_scores = []
+        global_step = 0
+        lag_sum = 0
+        wait_time = 0.0
+        epoch_start = time()
+        print(f"\nEpoch #{epoch + 1}")
+
+        def launch(group):
+            envs = groups[group]
+            actions[envs] = agent.get_actions(states[envs])
+            versions[group] = agent.policy_updates
+            vec_env.step_async(actions[envs], group)
+
+        def complete(group):
+            nonlocal global_step, lag_sum, wait_time
+            wait_start = time()
+            next_states, rewards, dones = vec_env.step_wait(group)
+            wait_time += time() - wait_start
+
+            envs = groups[group]
+            for i, env in enumerate(range(envs.start, envs.stop)):
+                next_state = terminal_state if dones[i] else next_states[i]
+                agent.append_memory(states[env], actions[env], rewards[i], next_state, dones[i], stream=env)
+                if dones[i]:
+                    train_scores.append(vec_env.final_episode_rewards[env])
+
+            states[envs] = next_states
+            global_step += len(dones)
+            lag_sum += len(dones) * int(agent.updates - versions[group])
+
+        for group in range(len(groups)):
+            launch(group)
+
+        # the steps started last are completed after the loop
+        for _ in trange(steps_per_epoch // num_envs - 1, leave=False):
+            if policy_lag == 0:
+                for group in range(len(groups)):
+                    complete(group)
+                if global_step > agent.batch_size:
+                    updates_due = train_for_steps(agent, updates_due, num_envs, update_to_data_ratio)
+                for group in range(len(groups)):
+                    launch(group)
+            else:
+                for group in range(len(groups)):
+                    complete(group)
+                    launch(group)
+                if global_step > agent.batch_size:
+                    updates_due = train_for_steps(agent, updates_due, num_envs, update_to_data_ratio)
+
+        for group in range(len(groups)):
+            complete(group)
+
+        env_steps += global_step
+        epoch_time = time() - epoch_start
         print(
-            "Results: mean: {:.1f} +/- {:.1f},".format(
-                train_scores.mean(), train_scores.std()
-            ),
-            "min: %.1f," % train_scores.min(),
-            "max: %.1f," % train_scores.max(),
+            "Pipeline: env %.0f steps/s, %.0f%% of the time waiting for the envs, policy lag %.2f"
+            % (global_step / epoch_time, 100 * wait_time / epoch_time, lag_sum / global_step)
         )
 
+        metrics = {
+            "env_steps_per_sec": global_step / epoch_time,
+            "env_wait_fraction": wait_time / epoch_time,
+            "policy_lag": lag_sum / global_step,
+        }
+        if epoch_end(agent, epoch, env_steps, train_scores, metrics):
+            break
+
+    return epoch_end.close(agent)
+
+
+def run_actor_learner_training(
+    wandb_run,
+    save_path,
+    actor_pool,
+    agent,
+    num_epochs,
+    steps_per_epoch=2000,
+    update_to_data_ratio=1.0,
+    weight_publish_interval=100,
+    epoch_callback=None,
+    evaluator=None,
+    int8_acting=False,
+    save_model=True,
+):
+    """
+    Learner side of the actor/learner split: appends the transitions streamed
+    by the actor processes of actor_pool and trains continuously, keeping
+    train steps / env steps at update_to_data_ratio. The q_net weights are
+    published to the actors every weight_publish_interval train steps.
+    steps_per_epoch counts env steps summed over all actors.
+    """
 
-        test_score = -5
-        #test(game, agent, actions, base_reward_per_step)
+    epoch_end = EpochEnd(wandb_run, save_path, evaluator, int8_acting, save_model, epoch_callback)
+    env_steps = 0
+    train_steps = 0
+    actor_pool.publish(agent.q_net)
 
-        wandb_run.log(
-            {
-                "train_score": train_scores.mean(), 
-                "test_score": test_score,
-                "global_step": global_step,
-            }
+    for epoch in range(num_epochs):
+
+        train_scores = []
+        epoch_start = time()
+        epoch_env_steps = 0
+        epoch_train_steps = 0
+        learn_time = 0.0
+        actor_steps = np.zeros(actor_pool.num_actors)
+        acting_time = np.zeros(actor_pool.num_actors)
+        print(f"\nEpoch #{epoch + 1}")
+
+        while epoch_env_steps < steps_per_epoch:
+
+            # train while the ratio allows it, otherwise wait for the actors,
+            # who block once the transition queue is full
+            if env_steps > agent.batch_size and train_steps < update_to_data_ratio * env_steps:
+                train_start = time()
+                agent.train()
+                learn_time += time() - train_start
+                train_steps += 1
+                epoch_train_steps += 1
+                if train_steps % weight_publish_interval == 0:
+                    actor_pool.publish(agent.q_net)
+                continue
+
+            chunk = actor_pool.get()
+            if chunk is None:
+                continue
+
+            for i in range(len(chunk.actions)):
+                agent.append_memory(
+                    chunk.states[i],
+                    chunk.actions[i],
+                    chunk.rewards[i],
+                    chunk.next_states[i],
+                    chunk.dones[i],
+                    stream=chunk.actor,
+                )
+            env_steps += len(chunk.actions)
+            epoch_env_steps += len(chunk.actions)
+            actor_steps[chunk.actor] += len(chunk.actions)
+            acting_time[chunk.actor] += chunk.acting_time
+            train_scores.extend(chunk.scores)
+
+        epoch_time = time() - epoch_start
+
+        # per-role throughputs, each over the time the role spent working
+        actor_steps_per_sec = (actor_steps / np.maximum(acting_time, 1e-9)).sum()
+        learner_steps_per_sec = epoch_train_steps / max(learn_time, 1e-9)
+        print(
+            "Throughput: env %.0f steps/s (actors %.0f), train %.0f steps/s (learner %.0f), update-to-data %.2f"
+            % (
+                epoch_env_steps / epoch_time,
+                actor_steps_per_sec,
+                epoch_train_steps / epoch_time,
+                learner_steps_per_sec,
+                epoch_train_steps / epoch_env_steps,
+            )
         )
 
-        if AGENT_CONFIG.save_model:
-            #print("Saving the network weights to:", AGENT_CONFIG.model_savefile)
-            torch.save(agent.q_net, save_path + "/model.pth")
+        metrics = {
+            "env_steps_per_sec": epoch_env_steps / epoch_time,
+            "train_steps_per_sec": epoch_train_steps / epoch_time,
+            "actor_steps_per_sec": actor_steps_per_sec,
+            "learner_steps_per_sec": learner_steps_per_sec,
+            "update_to_data": epoch_train_steps / epoch_env_steps,
+        }
+        if epoch_end(agent, epoch, env_steps, train_scores, metrics):
+            break
+
+    return epoch_end.close(agent)
+
+
+def create_evaluator(agent_config, level_name, action_count):
+    """AsyncEvaluator of the eval_levels, or of level_name when there are none, if async_eval is on"""
+    if not agent_config.async_eval:
+        return None
+    return AsyncEvaluator(
+        agent_config.eval_levels or [level_name],
+        agent_config,
+        action_count,
+        agent_config.test_episodes_per_epoch,
+    )
+
 
-        print("Total elapsed time: %.2f minutes" % ((time() - start_time) / 60.0))
+def log_evaluations(wandb_run, evaluator, wait=False):
+    """
+    Logs the test scores of the snapshots the evaluator is done with against
+    the global step they were taken at, waiting for all of them if wait is set
+    """
+    for epoch, global_step, level_scores in evaluator.poll(wait):
+        test_score = np.mean(list(level_scores.values()))
+        print("Test score of epoch %d: %.1f" % (epoch, test_score), level_scores)
+        metrics = {"test_score": test_score, "global_step": global_step}
+        if len(level_scores) > 1:
+            metrics.update({f"test_score/{level}": score for level, score in level_scores.items()})
+        wandb_run.log(metrics)
 
-    doom_env.close_env()
 
-class DuelQNet(nn.Module):
+def run_multi_seed_training(wandb_runs, save_paths, vec_env, agent, num_epochs, steps_per_epoch=2000, epoch_callbacks=None, evaluators=None, save_model=True):
     """
-    This is Duel DQN architecture.
-    see https://arxiv.org/abs/1511.06581 for more information.
+    Trains the seeds of a StackedDQNAgent in lockstep, seed k playing env k of
+    the VecDoomEnv pool and logging to wandb_runs[k]. steps_per_epoch counts
+    the env steps of each seed, as in run_training. epoch_callbacks and
+    evaluators hold one epoch_callback and evaluator (or None) per seed, see
+    run_training; as the seeds share every train step, training stops once
+    all their callbacks asked for it. Returns the epoch scores of each seed.
     """
 
-    def __init__(self, available_actions_count):
-        super().__init__()
-        self.conv1 = nn.Sequential(
-            nn.Conv2d(1, 8, kernel_size=3, stride=2, bias=False),
-            nn.BatchNorm2d(8),
-            nn.ReLU(),
-        )
+    num_seeds = agent.num_seeds
+    epoch_callbacks = epoch_callbacks or [None] * num_seeds
+    evaluators = evaluators or [None] * num_seeds
+    epoch_ends = [
+        EpochEnd(wandb_runs[seed], save_paths[seed], evaluators[seed], save_model=save_model,
+                 epoch_callback=epoch_callbacks[seed], label=f"Seed {seed} results")
+        for seed in range(num_seeds)
+    ]
+    # env steps of each seed
+    env_steps = 0
+    terminal_state = np.zeros(vec_env.state_shape, dtype=np.float32)
+    terminal_state.setflags(write=False)
 
-        self.conv2 = nn.Sequential(
-            nn.Conv2d(8, 8, kernel_size=3, stride=2, bias=False),
-            nn.BatchNorm2d(8),
-            nn.ReLU(),
-        )
+    for epoch in range(num_epochs):
 
-        self.conv3 = nn.Sequential(
-            nn.Conv2d(8, 8, kernel_size=3, stride=1, bias=False),
-            nn.BatchNorm2d(8),
-            nn.ReLU(),
-        )
+        states = vec_env.reset().copy()
 
-        self.conv4 = nn.Sequential(
-            nn.Conv2d(8, 16, kernel_size=3, stride=1, bias=False),
-            nn.BatchNorm2d(16),
-            nn.ReLU(),
-        )
+        train_scores = [[] for _ in range(num_seeds)]
+        global_step = 0
+        print(f"\nEpoch #{epoch + 1}")
 
-        self.state_fc = nn.Sequential(nn.Linear(96, 64), nn.ReLU(), nn.Linear(64, 1))
+        for _ in trange(steps_per_epoch, leave=False):
 
-        self.advantage_fc = nn.Sequential(
-            nn.Linear(96, 64), nn.ReLU(), nn.Linear(64, available_actions_count)
-        )
+            actions = agent.get_actions(states)
+            next_states, rewards, dones = vec_env.step(actions)
 
-    def forward(self, x):
-        x = self.conv1(x)
-        x = self.conv2(x)
-        x = self.conv3(x)
-        x = self.conv4(x)
-        x = x.view(-1, 192)
-        x1 = x[:, :96]  # input for the net to calculate the state value
-        x2 = x[:, 96:]  # relative advantage of actions in the state
-        state_value = self.state_fc(x1).reshape(-1, 1)
-        advantage_values = self.advantage_fc(x2)
-        x = state_value + (
-            advantage_values - advantage_values.mean(dim=1).reshape(-1, 1)
-        )
+            for seed in range(num_seeds):
+                next_state = terminal_state if dones[seed] else next_states[seed]
+                agent.append_memory(seed, states[seed], actions[seed], rewards[seed], next_state, dones[seed])
+
+                if dones[seed]:
+                    train_scores[seed].append(vec_env.final_episode_rewards[seed])
+
+            if global_step > agent.batch_size:
+                agent.train()
+
+            states = next_states.copy()
+            global_step += 1
+
+        env_steps += global_step
+        agent.update_target_net()
+
+        stopped = [
+            epoch_end.log(epoch, env_steps, train_scores[seed], agent.export_q_net(seed), agent.memories[seed])
+            for seed, epoch_end in enumerate(epoch_ends)
+        ]
+        if all(stopped):
+            print("Training stopped after %d epochs" % (epoch + 1))
+            break
+
+    return [epoch_end.close() for epoch_end in epoch_ends]
 
-        return x
 
 class DQNAgent:
     def __init__(
         self,
         action_size,
-        memory_size,
+        memory,
         batch_size,
         discount_factor,
         lr,
@@ -227,6 +592,12 @@ class DQNAgent:
         epsilon=1,
         epsilon_decay=0.9996,
         epsilon_min=0.1,
+        prefetch_batches=0,
+        pin_memory=False,
+        net_config=None,
+        inference_backend="eager",
+        concat_forward=None,
+        policy_refresh_interval=10,
     ):
         self.action_size = action_size
         self.epsilon = epsilon
@@ -235,72 +606,160 @@ class DQNAgent:
         self.batch_size = batch_size
         self.discount = discount_factor
         self.lr = lr
-        self.memory = deque(maxlen=memory_size)
+        # any of the buffers from replay_buffer.py, see create_replay_memory
+        self.memory = memory
+        # held for every memory access once a prefetcher thread samples from it
+        self.memory_lock = threading.Lock()
+        self.prefetch_batches = prefetch_batches
+        self.pin_memory = pin_memory
+        self.prefetcher = None
+        # train steps done so far, and those included in the weights actions
+        # are chosen with
+        self.updates = 0
+        self.policy_updates = 0
         self.criterion = nn.MSELoss()
+        # one q_net forward over states and next states in train(), fewer
+        # kernel launches on the GPU but a backward over twice the rows, which
+        # is slower on CPU, see benchmarks/bench_train_step.py
+        self.concat_forward = DEVICE.type == "cuda" if concat_forward is None else concat_forward
 
         if load_model:
             print("Loading model from: ", AGENT_CONFIG.model_savefile)
-            self.q_net = torch.load(AGENT_CONFIG.model_savefile)
-            self.target_net = torch.load(AGENT_CONFIG.model_savefile)
+            self.q_net = load_q_net(AGENT_CONFIG.model_savefile, DEVICE)
+            self.target_net = load_q_net(AGENT_CONFIG.model_savefile, DEVICE)
             self.epsilon = self.epsilon_min
 
         else:
+            # the network keys of net_config shape DuelQNet, see build_duel_qnet
+            net_config = net_config or AGENT_CONFIG
             print("Initializing new model")
-            self.q_net = DuelQNet(action_size).to(DEVICE)
-            self.target_net = DuelQNet(action_size).to(DEVICE)
+            self.q_net = build_duel_qnet(net_config, action_size).to(DEVICE)
+            self.target_net = build_duel_qnet(net_config, action_size).to(DEVICE)
+            print(self.q_net.summary())
 
         self.opt = optim.SGD(self.q_net.parameters(), lr=self.lr)
+        # acts with q_net. The fused backends refold it every
+        # policy_refresh_interval updates and at every target net update,
+        # acting up to that many updates behind q_net: refolding after every
+        # update would cost more than the fused forward saves
+        self.policy_net = InferenceQNet(self.q_net, inference_backend, auto_refresh=False)
+        self.policy_refresh_interval = 1 if inference_backend == "eager" else policy_refresh_interval
+
+    def get_greedy_actions(self, states):
+        """Greedy action indices of policy_net for a batch of states of shape (N, frame_stack, H, W)"""
+        states = torch.from_numpy(np.asarray(states, dtype=np.float32)).to(DEVICE)
+        return torch.argmax(self.policy_net(states), dim=1).cpu().numpy()
+
+    def get_actions(self, states):
+        """
+        Epsilon-greedy action indices for a batch of states of shape (N, frame_stack, H, W).
+        The exploring rows are drawn at once, only the greedy ones go through policy_net.
+        """
+        n = len(states)
+        actions = np.random.randint(self.action_size, size=n)
+        greedy = np.random.uniform(size=n) >= self.epsilon
+        if greedy.any():
+            actions[greedy] = self.get_greedy_actions(np.asarray(states)[greedy])
+        return actions
 
     def get_action(self, state):
-        if np.random.uniform() < self.epsilon:
-            return random.choice(range(self.action_size))
-        else:
-            state = np.expand_dims(state, axis=0)
-            state = torch.from_numpy(state).float().to(DEVICE)
-            action = torch.argmax(self.q_net(state)).item()
-            return action
+        return int(self.get_actions(state[np.newaxis])[0])
 
     def update_target_net(self):
         self.target_net.load_state_dict(self.q_net.state_dict())
-
-    def append_memory(self, state, action, reward, next_state, done):
-        self.memory.append((state, action, reward, next_state, done))
+        self.refresh_policy()
+
+    def refresh_policy(self):
+        """Brings policy_net up to date with q_net, unless it is an int8 snapshot of quantize_policy()"""
+        if isinstance(self.policy_net, InferenceQNet):
+            self.policy_net.refresh()
+            self.policy_updates = self.updates
+
+    def quantize_policy(self, num_states=1024):
+        """
+        Switches acting to an int8 snapshot of q_net, calibrated on num_states
+        replay states, until the next call. Returns the greedy-action agreement
+        with the float32 net on as many other replay states.
+        """
+        with self.memory_lock:
+            calibration_states = replay_states(self.memory, num_states)
+            check_states = replay_states(self.memory, num_states)
+        self.policy_net = QuantizedQNet(self.q_net, calibration_states)
+        self.policy_updates = self.updates
+        agreement, max_q_diff = self.policy_net.agreement(self.q_net, check_states)
+        print("Int8 policy: greedy-action agreement %.1f%%, max Q difference %.3f" % (100 * agreement, max_q_diff))
+        return {"int8_agreement": agreement, "int8_max_q_diff": max_q_diff}
+
+    def append_memory(self, state, action, reward, next_state, done, stream=0):
+        with self.memory_lock:
+            self.memory.append(state, action, reward, next_state, done, stream)
+
+    def sample_batch(self):
+        if not self.prefetch_batches:
+            return self.memory.sample(self.batch_size)
+
+        if self.prefetcher is None:
+            # started on the first train step, once the memory holds a batch
+            self.prefetcher = BatchPrefetcher(
+                self.memory,
+                self.batch_size,
+                self.memory_lock,
+                depth=self.prefetch_batches,
+                pin_memory=self.pin_memory,
+                device=DEVICE,
+            )
+        return self.prefetcher.get()
+
+    def close(self):
+        """Stops the prefetching thread and writes the replay memory out if it is on disk"""
+        if self.prefetcher is not None:
+            self.prefetcher.close()
+            self.prefetcher = None
+        with self.memory_lock:
+            self.memory.flush()
 
     def train(self):
-        batch = random.sample(self.memory, self.batch_size)
-        batch = np.array(batch, dtype=object)
-
-        states = np.stack(batch[:, 0]).astype(float)
-        actions = batch[:, 1].astype(int)
-        rewards = batch[:, 2].astype(float)
-        next_states = np.stack(batch[:, 3]).astype(float)
-        dones = batch[:, 4].astype(bool)
-        not_dones = ~dones
+        batch = self.sample_batch()
+        states, actions, rewards, next_states, dones = batch[:5]
 
-        row_idx = np.arange(self.batch_size)  # used for indexing the batch
+        # the q values of the next states only pick the actions evaluated by the target net
+        if self.concat_forward:
+            q_values, next_q_values = self.q_net(torch.cat((states, next_states))).split(len(states))
+        else:
+            with torch.no_grad():
+                next_q_values = self.q_net(next_states)
+            q_values = self.q_net(states)
 
-        # value of the next states with double q learning
+        # value of the next states with double q learning, computed on the
+        # device without going through NumPy
         # see https://arxiv.org/abs/1509.06461 for more information on double q learning
         with torch.no_grad():
-            next_states = torch.from_numpy(next_states).float().to(DEVICE)
-            idx = row_idx, np.argmax(self.q_net(next_states).cpu().data.numpy(), 1)
-            next_state_values = self.target_net(next_states).cpu().data.numpy()[idx]
-            next_state_values = next_state_values[not_dones]
+            next_actions = next_q_values.argmax(dim=1, keepdim=True)
+            next_state_values = self.target_net(next_states).gather(1, next_actions).squeeze(1)
 
-        # this defines y = r + discount * max_a q(s', a)
-        q_targets = rewards.copy()
-        q_targets[not_dones] += self.discount * next_state_values
-        q_targets = torch.from_numpy(q_targets).float().to(DEVICE)
+            # this defines y = r + discount * max_a q(s', a), with n-step replay
+            # r sums n rewards and the discount is raised to the power n
+            discounts = self.discount if batch.discounts is None else batch.discounts
+            q_targets = rewards + discounts * next_state_values * ~dones
 
         # this selects only the q values of the actions taken
-        idx = row_idx, actions
-        states = torch.from_numpy(states).float().to(DEVICE)
-        action_values = self.q_net(states)[idx].float().to(DEVICE)
+        action_values = q_values.gather(1, actions.unsqueeze(1)).squeeze(1)
 
         self.opt.zero_grad()
-        td_error = self.criterion(q_targets, action_values)
-        td_error.backward()
+        if batch.weights is None:
+            loss = self.criterion(q_targets, action_values)
+        else:
+            # prioritized replay, importance-sampling weighted loss and new
+            # priorities from the TD errors of this batch
+            td_errors = q_targets - action_values
+            loss = (batch.weights * td_errors.pow(2)).mean()
+            with self.memory_lock:
+                self.memory.update_priorities(batch.indices, td_errors.detach().cpu().numpy())
+        loss.backward()
         self.opt.step()
+        self.updates += 1
+        if self.updates % self.policy_refresh_interval == 0:
+            self.refresh_policy()
 
         if self.epsilon > self.epsilon_min:
             self.epsilon *= self.epsilon_decay
@@ -308,24 +767,222 @@ class DQNAgent:
             self.epsilon = self.epsilon_min
 
 
-def run_training_for_DQN(level_name, wandb_run, agent_config, save_path):
+class StackedDQNAgent:
+    """
+    num_seeds independent DQN agents trained in lockstep: their q_nets are
+    the seeds of one StackedDuelQNet, so acting and every train step are a
+    single forward / backward for all seeds. Each seed keeps its own replay
+    memory and exploration draws, its loss and gradients are those it would
+    get alone.
+    """
 
-    doom_env = DoomEnv(level_name, agent_config)
-   
-    n = doom_env.get_action_space_size()
-    actions = [list(a) for a in it.product([0, 1], repeat=n)]
+    def __init__(
+        self,
+        action_size,
+        memories,
+        batch_size,
+        discount_factor,
+        lr,
+        epsilon=1,
+        epsilon_decay=0.9996,
+        epsilon_min=0.1,
+        net_config=None,
+    ):
+        self.num_seeds = len(memories)
+        self.action_size = action_size
+        self.epsilon = epsilon
+        self.epsilon_decay = epsilon_decay
+        self.epsilon_min = epsilon_min
+        self.batch_size = batch_size
+        self.discount = discount_factor
+        self.lr = lr
+        self.memories = memories
+        self.net_config = net_config or AGENT_CONFIG
+
+        # the grouped convs of the stacked net in the channels_last memory
+        # format, which oneDNN runs about twice as fast on CPU, see
+        # benchmarks/bench_stacked_seeds.py
+        self.channels_last = DEVICE.type == "cpu"
+        memory_format = torch.channels_last if self.channels_last else torch.contiguous_format
+
+        print("Initializing %d stacked models" % self.num_seeds)
+        # independently initialised DuelQNets, one per seed
+        q_nets = [build_duel_qnet(self.net_config, action_size) for _ in range(self.num_seeds)]
+        print(q_nets[0].summary())
+        self.q_net = StackedDuelQNet.from_q_nets(q_nets).to(DEVICE, memory_format=memory_format)
+        self.target_net = StackedDuelQNet.from_q_nets(q_nets).to(DEVICE, memory_format=memory_format)
 
-    # Initialize our agent with the set parameters
-    agent = DQNAgent(
-        len(actions),
+        self.opt = optim.SGD(self.q_net.parameters(), lr=self.lr)
+
+    def get_actions(self, states):
+        """Epsilon-greedy action index of each seed, states holds one state per seed"""
+        actions = np.random.randint(self.action_size, size=self.num_seeds)
+        greedy = np.random.uniform(size=self.num_seeds) >= self.epsilon
+        if greedy.any():
+            states = torch.from_numpy(np.asarray(states, dtype=np.float32)).to(DEVICE)
+            self.q_net.eval()
+            with torch.no_grad():
+                q_values = self.q_net(stack_states(states[:, np.newaxis], self.channels_last))[:, 0]
+            self.q_net.train()
+            actions[greedy] = torch.argmax(q_values, dim=1).cpu().numpy()[greedy]
+        return actions
+
+    def update_target_net(self):
+        self.target_net.load_state_dict(self.q_net.state_dict())
+
+    def export_q_net(self, seed):
+        """DuelQNet holding the current weights of seed"""
+        q_net = build_duel_qnet(self.net_config, self.action_size).to(DEVICE)
+        return self.q_net.export_seed(seed, q_net)
+
+    def append_memory(self, seed, state, action, reward, next_state, done):
+        self.memories[seed].append(state, action, reward, next_state, done)
+
+    def train(self):
+        batches = [memory.sample(self.batch_size) for memory in self.memories]
+        # (seeds, B, ...) per field, states stacked along the channels
+        states = stack_states(torch.stack([batch.states for batch in batches]), self.channels_last)
+        next_states = stack_states(torch.stack([batch.next_states for batch in batches]), self.channels_last)
+        actions, rewards, dones = (
+            torch.stack([batch[i] for batch in batches]) for i in (1, 2, 4)
+        )
+
+        q_values = self.q_net(states)
+
+        # value of the next states with double q learning, for every seed
+        with torch.no_grad():
+            next_actions = self.q_net(next_states).argmax(dim=2, keepdim=True)
+            next_state_values = self.target_net(next_states).gather(2, next_actions).squeeze(2)
+
+            if batches[0].discounts is None:
+                discounts = self.discount
+            else:
+                discounts = torch.stack([batch.discounts for batch in batches])
+            q_targets = rewards + discounts * next_state_values * ~dones
+
+        action_values = q_values.gather(2, actions.unsqueeze(2)).squeeze(2)
+
+        # the mean loss of each seed, summed so every seed gets its own gradient
+        td_errors = q_targets - action_values
+        if batches[0].weights is None:
+            loss = td_errors.pow(2).mean(dim=1).sum()
+        else:
+            weights = torch.stack([batch.weights for batch in batches])
+            loss = (weights * td_errors.pow(2)).mean(dim=1).sum()
+            for memory, batch, seed_td_errors in zip(self.memories, batches, td_errors.detach().cpu().numpy()):
+                memory.update_priorities(batch.indices, seed_td_errors)
+
+        self.opt.zero_grad()
+        loss.backward()
+        self.opt.step()
+
+        if self.epsilon > self.epsilon_min:
+            self.epsilon *= self.epsilon_decay
+        else:
+            self.epsilon = self.epsilon_min
+
+
+def create_replay_memory(agent_config, save_path, num_streams=1):
+    """
+    Replay memory set up from the agent config. With replay_on_disk it is
+    memory-mapped under the run directory, with replay_resume_dir the buffer
+    saved there by an earlier run is copied under the run directory and the
+    copy is appended to.
+    """
+    # beta of prioritized replay reaches 1 by the end of training
+    train_steps = agent_config.train_epochs * agent_config.learning_steps_per_epoch
+
+    if agent_config.replay_resume_dir:
+        # the runs of a series or sweep start at once from the same buffer,
+        # each writes its own copy so they do not overwrite each other
+        storage_dir = save_path + "/replay"
+        if not (os.path.exists(storage_dir) and os.path.samefile(agent_config.replay_resume_dir, storage_dir)):
+            print("Copying replay memory from: ", agent_config.replay_resume_dir)
+            shutil.copytree(agent_config.replay_resume_dir, storage_dir, dirs_exist_ok=True)
+        memory = open_replay_buffer(storage_dir, device=DEVICE)
+        if agent_config.prioritized_replay:
+            memory = PrioritizedReplayBuffer(
+                memory,
+                alpha=agent_config.priority_alpha,
+                beta=agent_config.priority_beta,
+                beta_steps=train_steps,
+            )
+        return memory
+
+    storage_dir = save_path + "/replay" if agent_config.replay_on_disk else None
+
+    return create_replay_buffer(
+        agent_config.replay_storage,
+        agent_config.replay_memory_size,
+        (agent_config.frame_stack, *agent_config.resolution),
+        device=DEVICE,
+        frame_stack=agent_config.frame_stack,
+        num_streams=num_streams,
+        prioritized=agent_config.prioritized_replay,
+        priority_alpha=agent_config.priority_alpha,
+        priority_beta=agent_config.priority_beta,
+        priority_beta_steps=train_steps,
+        storage_dir=storage_dir,
+        n_step=agent_config.n_step,
+        discount=agent_config.discount_factor,
+    )
+
+
+def create_agent(agent_config, action_count, save_path, num_streams=1):
+    """DQNAgent set up from the agent config, num_streams is the number of envs feeding it"""
+    return DQNAgent(
+        action_count,
+        memory=create_replay_memory(agent_config, save_path, num_streams),
         lr=agent_config.learning_rate,
         batch_size=agent_config.batch_size,
-        memory_size=agent_config.replay_memory_size,
         discount_factor=agent_config.discount_factor,
         load_model=agent_config.load_model,
+        prefetch_batches=agent_config.prefetch_batches,
+        pin_memory=agent_config.pin_memory,
+        net_config=agent_config,
+        inference_backend=agent_config.inference_backend,
+        concat_forward=agent_config.concat_train_forward,
+        policy_refresh_interval=agent_config.policy_refresh_interval,
+    )
+
+
+def create_stacked_agent(agent_config, action_count, save_paths):
+    """StackedDQNAgent with one seed per run directory of save_paths"""
+    return StackedDQNAgent(
+        action_count,
+        memories=[create_replay_memory(agent_config, save_path) for save_path in save_paths],
+        lr=agent_config.learning_rate,
+        batch_size=agent_config.batch_size,
+        discount_factor=agent_config.discount_factor,
+        net_config=agent_config,
     )
 
-    run_training(
+
+def run_training_for_DQN(level_name, wandb_run, agent_config, save_path, epoch_callback=None):
+    """
+    Trains a DQN agent on level_name and returns the mean train score of each
+    epoch. See run_training for epoch_callback.
+    """
+
+    if agent_config.num_actors > 0:
+        return run_actor_learner_for_DQN(level_name, wandb_run, agent_config, save_path, epoch_callback)
+
+    if agent_config.pipelined_stepping:
+        return run_pipelined_training_for_DQN(level_name, wandb_run, agent_config, save_path, epoch_callback)
+
+    if agent_config.num_envs > 1:
+        return run_vec_training_for_DQN(level_name, wandb_run, agent_config, save_path, epoch_callback)
+
+    doom_env = ENV_POOL.acquire(level_name, agent_config)
+   
+    n = doom_env.get_action_space_size()
+    actions = [list(a) for a in it.product([0, 1], repeat=n)]
+
+    # Initialize our agent with the set parameters
+    agent = create_agent(agent_config, len(actions), save_path)
+    evaluator = create_evaluator(agent_config, level_name, len(actions))
+
+    epoch_scores = run_training(
         wandb_run,
         save_path,
         #game,
@@ -334,7 +991,12 @@ def run_training_for_DQN(level_name, wandb_run, agent_config, save_path):
         actions,
         num_epochs=agent_config.train_epochs,
         frame_repeat=agent_config.frame_repeat,
-        steps_per_epoch=agent_config.learning_steps_per_epoch
+        steps_per_epoch=agent_config.learning_steps_per_epoch,
+        epoch_callback=epoch_callback,
+        evaluator=evaluator,
+        int8_acting=agent_config.int8_acting,
+        save_model=agent_config.save_model,
+        update_to_data_ratio=agent_config.update_to_data_ratio,
     )
 
     # print("======================================")
@@ -343,31 +1005,236 @@ def run_training_for_DQN(level_name, wandb_run, agent_config, save_path):
 
     # Reinitialize the game with window visible
     #game.close()
-    doom_env.close_env()
+    # back to the pool, run_training no longer closes it
+    ENV_POOL.release(doom_env)
     # game.set_window_visible(True)
     # game.set_mode(vzd.Mode.ASYNC_PLAYER)
     # game.init()
     # pass
+    return epoch_scores
 
 
-save_dir = "model_checkpoints/"
+def run_vec_training_for_DQN(level_name, wandb_run, agent_config, save_path, epoch_callback=None):
 
-for run_nb in range(NB_RUNS):
+    vec_env = VecDoomEnv(
+        level_name,
+        agent_config,
+        num_envs=agent_config.num_envs,
+        frame_repeat=agent_config.frame_repeat,
+    )
 
-    run_name = level_details["level_name"] + f"-run-{run_nb}--{series_timestamp}"
-    run_save_dir = save_dir + run_name
+    agent = create_agent(agent_config, len(vec_env.actions), save_path, num_streams=vec_env.num_envs)
+    evaluator = create_evaluator(agent_config, level_name, len(vec_env.actions))
 
-    # create run name directory
-    os.makedirs(run_save_dir, exist_ok=True)
+    epoch_scores = run_vec_training(
+        wandb_run,
+        save_path,
+        vec_env,
+        agent,
+        num_epochs=agent_config.train_epochs,
+        steps_per_epoch=agent_config.learning_steps_per_epoch,
+        epoch_callback=epoch_callback,
+        evaluator=evaluator,
+        int8_acting=agent_config.int8_acting,
+        save_model=agent_config.save_model,
+        update_to_data_ratio=agent_config.update_to_data_ratio,
+    )
+    vec_env.close_env()
+
+    print("Training finished.")
+    return epoch_scores
+
+
+def run_pipelined_training_for_DQN(level_name, wandb_run, agent_config, save_path, epoch_callback=None):
+
+    if agent_config.num_envs > 1:
+        # double buffered, one half of the envs simulates while the other is acted on
+        vec_env = VecDoomEnv(
+            level_name,
+            agent_config,
+            num_envs=agent_config.num_envs,
+            frame_repeat=agent_config.frame_repeat,
+            num_groups=2,
+        )
+    else:
+        doom_env = ENV_POOL.acquire(level_name, agent_config)
+        vec_env = ThreadedDoomEnv(doom_env, agent_config.frame_repeat)
+
+    agent = create_agent(agent_config, len(vec_env.actions), save_path, num_streams=vec_env.num_envs)
+    evaluator = create_evaluator(agent_config, level_name, len(vec_env.actions))
+
+    epoch_scores = run_pipelined_training(
+        wandb_run,
+        save_path,
+        vec_env,
+        agent,
+        num_epochs=agent_config.train_epochs,
+        steps_per_epoch=agent_config.learning_steps_per_epoch,
+        policy_lag=agent_config.policy_lag,
+        epoch_callback=epoch_callback,
+        evaluator=evaluator,
+        int8_acting=agent_config.int8_acting,
+        save_model=agent_config.save_model,
+        update_to_data_ratio=agent_config.update_to_data_ratio,
+    )
+
+    if agent_config.num_envs > 1:
+        vec_env.close_env()
+    else:
+        vec_env.close()
+        ENV_POOL.release(doom_env)
+
+    print("Training finished.")
+    return epoch_scores
+
+
+def run_actor_learner_for_DQN(level_name, wandb_run, agent_config, save_path, epoch_callback=None):
+
+    actor_pool = ActorPool(
+        level_name,
+        agent_config,
+        num_actors=agent_config.num_actors,
+        chunk_size=agent_config.actor_chunk_size,
+        queue_size=agent_config.actor_queue_size,
+        epsilon_base=agent_config.actor_epsilon,
+        epsilon_alpha=agent_config.actor_epsilon_alpha,
+    )
+
+    # one replay stream per actor, so each keeps its trajectories in order
+    agent = create_agent(agent_config, len(actor_pool.actions), save_path, num_streams=actor_pool.num_actors)
+    evaluator = create_evaluator(agent_config, level_name, len(actor_pool.actions))
+
+    epoch_scores = run_actor_learner_training(
+        wandb_run,
+        save_path,
+        actor_pool,
+        agent,
+        num_epochs=agent_config.train_epochs,
+        steps_per_epoch=agent_config.learning_steps_per_epoch,
+        update_to_data_ratio=agent_config.update_to_data_ratio,
+        weight_publish_interval=agent_config.weight_publish_interval,
+        epoch_callback=epoch_callback,
+        evaluator=evaluator,
+        int8_acting=agent_config.int8_acting,
+        save_model=agent_config.save_model,
+    )
+    actor_pool.close_env()
+
+    print("Training finished.")
+    return epoch_scores
+
+
+def run_multi_seed_training_for_DQN(level_name, wandb_runs, agent_config, save_paths, epoch_callbacks=None):
+    """
+    Trains one seed per run directory of save_paths as a StackedDQNAgent and
+    returns the epoch scores of each seed, see run_multi_seed_training.
+
+    The seeds act with their stacked net, so inference_backend does not
+    apply, and the prefetching, int8 acting, pipelined and actor-learner
+    modes are not supported. Every seed starts from a new model, load_model
+    would load the same model_savefile into all of them. With
+    replay_resume_dir each seed resumes from its own copy of the buffer,
+    see create_replay_memory.
+    """
+    unsupported = [
+        key for key in ("prefetch_batches", "int8_acting", "pipelined_stepping", "num_actors", "load_model")
+        if getattr(agent_config, key)
+    ]
+    if agent_config.num_envs > 1:
+        # each seed plays one env
+        unsupported.append("num_envs")
+    if unsupported:
+        raise ValueError(f"stacked_seeds does not support {', '.join(unsupported)}")
+
+    vec_env = VecDoomEnv(
+        level_name,
+        agent_config,
+        num_envs=len(save_paths),
+        frame_repeat=agent_config.frame_repeat,
+    )
+
+    agent = create_stacked_agent(agent_config, len(vec_env.actions), save_paths)
+    evaluators = [create_evaluator(agent_config, level_name, len(vec_env.actions)) for _ in save_paths]
 
+    epoch_scores = run_multi_seed_training(
+        wandb_runs,
+        save_paths,
+        vec_env,
+        agent,
+        num_epochs=agent_config.train_epochs,
+        steps_per_epoch=agent_config.learning_steps_per_epoch,
+        epoch_callbacks=epoch_callbacks,
+        evaluators=evaluators,
+        save_model=agent_config.save_model,
+    )
+    vec_env.close_env()
+
+    print("Training finished.")
+    return epoch_scores
+
+
+def run_series_member(level_name, run_name, group, agent_config, save_path, epoch_callback=None):
+    """One run of a training series or sweep, as run by the workers of a RunScheduler"""
     wdb_run = wandb.init(
         project="doom-rl",
         name=run_name,
-        config=AGENT_CONFIG,
-        group=level_details["level_name"] + "-" + series_timestamp,
+        config=agent_config,
+        group=group,
     )
+    epoch_scores = run_training_for_DQN(level_name, wdb_run, agent_config, save_path, epoch_callback)
+    wdb_run.finish()
+    return epoch_scores
 
-    run_training_for_DQN(level_name, wdb_run, AGENT_CONFIG, run_save_dir)
 
-    wdb_run.finish()
+save_dir = "model_checkpoints/"
+
+# the guard keeps worker processes of the env pool from starting their own
+# training series when they import this module
+if __name__ == "__main__" and AGENT_CONFIG.stacked_seeds:
+
+    # every seed of the series in one process, trained as one stacked model
+    run_names = [
+        level_details["level_name"] + f"-run-{run_nb}--{series_timestamp}" for run_nb in range(NB_RUNS)
+    ]
+    run_save_dirs = [save_dir + run_name for run_name in run_names]
+    wdb_runs = []
+    for run_name, run_save_dir in zip(run_names, run_save_dirs):
+        os.makedirs(run_save_dir, exist_ok=True)
+        wdb_runs.append(wandb.init(
+            project="doom-rl",
+            name=run_name,
+            config=AGENT_CONFIG,
+            group=level_details["level_name"] + "-" + series_timestamp,
+            reinit="create_new",
+        ))
+
+    run_multi_seed_training_for_DQN(level_name, wdb_runs, AGENT_CONFIG, run_save_dirs)
+
+    for wdb_run in wdb_runs:
+        wdb_run.finish()
+
+elif __name__ == "__main__":
+
+    # the runs of the series in parallel worker processes, each logging to
+    # its run directory, and the outcome of all of them in one file
+    group = level_details["level_name"] + "-" + series_timestamp
+    scheduler = RunScheduler(AGENT_CONFIG.concurrent_runs, AGENT_CONFIG.threads_per_run)
+
+    for run_nb in range(NB_RUNS):
+
+        run_name = level_details["level_name"] + f"-run-{run_nb}--{series_timestamp}"
+        run_save_dir = save_dir + run_name
+
+        scheduler.submit(run_name, run_save_dir, run_series_member, level_name, run_name, group, AGENT_CONFIG, run_save_dir)
+
+    run_results = scheduler.run()
+
+    with open(save_dir + group + "-runs.json", "w") as f:
+        json.dump([run_result._asdict() for run_result in run_results], f, indent=4)
+
+    for run_result in run_results:
+        if run_result.exitcode == 0:
+            print(f"{run_result.name}: final train score {run_result.result[-1]:.1f}")
+        else:
+            print(f"{run_result.name}: failed, see {run_result.run_dir}/output.log\n{run_result.error}")
 
@@ -0,0 +1,104 @@
+import queue
+import threading
+
+import torch
+
+
+class BatchPrefetcher:
+    """
+    Samples the next depth minibatches of a replay memory on a background
+    thread while the caller runs its gradient and env steps.
+
+    Batches are written into depth + 2 preallocated slots (pinned if
+    pin_memory, to speed up copies to the GPU) which are recycled: the batch
+    returned by get() stays valid until the next call to get(). A slot is
+    sampled into again only once its non_blocking copy to the GPU is done.
+    Every access to the memory, including the caller's appends, must hold
+    lock.
+    """
+
+    def __init__(self, memory, batch_size, lock, depth=2, pin_memory=False, device="cpu"):
+        self.memory = memory
+        self.batch_size = batch_size
+        self.lock = lock
+        self.device = torch.device(device)
+
+        with lock:
+            template = memory.sample(batch_size)
+        # slots to sample into, each with the CUDA event of its last copy to
+        # the device, None if there is nothing to wait for
+        self._free = queue.Queue()
+        for _ in range(depth + 2):
+            self._free.put((self._allocate_slot(template, pin_memory), None))
+        self._ready = queue.Queue(maxsize=depth)
+        self._in_use = None
+
+        self._stop = threading.Event()
+        self._error = None
+        self._thread = threading.Thread(target=self._run, name="batch-prefetcher", daemon=True)
+        self._thread.start()
+
+    @staticmethod
+    def _allocate_slot(template, pin_memory):
+        pin_memory = pin_memory and torch.cuda.is_available()
+        return template._replace(**{
+            name: torch.empty(tensor.shape, dtype=tensor.dtype, pin_memory=pin_memory)
+            for name, tensor in template._asdict().items()
+            if isinstance(tensor, torch.Tensor)
+        })
+
+    def _run(self):
+        try:
+            while not self._stop.is_set():
+                try:
+                    slot, copied = self._free.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                if copied is not None:
+                    # the non_blocking copy of the slot may still be reading it
+                    copied.synchronize()
+
+                with self.lock:
+                    batch = self.memory.sample(self.batch_size, out=slot)
+
+                while not self._stop.is_set():
+                    try:
+                        self._ready.put((slot, batch), timeout=0.1)
+                        break
+                    except queue.Full:
+                        continue
+        except Exception as error:
+            self._error = error
+            self._stop.set()
+
+    def get(self):
+        """Next prefetched Batch, on device"""
+        if self._in_use is not None:
+            self._free.put(self._in_use)
+            self._in_use = None
+
+        while True:
+            if self._error is not None:
+                raise RuntimeError("Batch prefetching failed") from self._error
+            try:
+                slot, batch = self._ready.get(timeout=0.1)
+                break
+            except queue.Empty:
+                continue
+
+        if self.device.type == "cpu":
+            self._in_use = slot, None
+            return batch
+        batch = batch._replace(**{
+            name: tensor.to(self.device, non_blocking=True)
+            for name, tensor in batch._asdict().items()
+            if isinstance(tensor, torch.Tensor)
+        })
+        copied = torch.cuda.Event()
+        copied.record()
+        self._in_use = slot, copied
+        return batch
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
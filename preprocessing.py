@@ -0,0 +1,140 @@
+import numpy as np
+import vizdoom as vzd
+
+
+def _available_resolutions():
+    """(width, height) of every ViZDoom screen resolution, smallest first"""
+    resolutions = []
+    for name in dir(vzd.ScreenResolution):
+        if name.startswith("RES_"):
+            width, height = name[len("RES_"):].split("X")
+            resolutions.append((int(width), int(height)))
+    return sorted(resolutions, key=lambda r: r[0] * r[1])
+
+
+SCREEN_RESOLUTIONS = _available_resolutions()
+DEFAULT_RENDER_RESOLUTION = (640, 480)
+
+
+def native_resolution_for(resolution, min_ratio=2):
+    """
+    Smallest ViZDoom screen resolution that is an integer multiple (at least
+    min_ratio) of resolution = (height, width), or None if there is none.
+    """
+    height, width = resolution
+    for w, h in SCREEN_RESOLUTIONS:
+        if w % width == 0 and h % height == 0 and w // width >= min_ratio and h // height >= min_ratio:
+            return w, h
+    return None
+
+
+def render_resolution_for(resolution):
+    """ViZDoom ScreenResolution to render at for a given target (height, width)"""
+    width, height = native_resolution_for(resolution) or DEFAULT_RENDER_RESOLUTION
+    return getattr(vzd.ScreenResolution, f"RES_{width}X{height}")
+
+
+def _mirror(index, n):
+    # scipy.ndimage 'mirror' boundary mode: d c b | a b c d | c b a
+    if n == 1:
+        return np.zeros_like(index)
+    period = 2 * (n - 1)
+    index = np.abs(index) % period
+    return np.where(index >= n, period - index, index)
+
+
+def resize_matrix(n, m):
+    """
+    (m, n) matrix applying skimage.transform.resize's default 1D resampling
+    (gaussian anti-aliasing, then linear interpolation) from length n to m.
+    """
+    scale = n / m
+    rows = np.arange(n)
+
+    blur = np.eye(n)
+    sigma = max(0.0, (scale - 1) / 2)
+    if sigma > 0:
+        radius = int(4.0 * sigma + 0.5)
+        offsets = np.arange(-radius, radius + 1)
+        weights = np.exp(-0.5 * offsets ** 2 / sigma ** 2)
+        weights /= weights.sum()
+        blur = np.zeros((n, n))
+        for offset, weight in zip(offsets, weights):
+            np.add.at(blur, (rows, _mirror(rows + offset, n)), weight)
+
+    coords = (np.arange(m) + 0.5) * scale - 0.5
+    low = np.floor(coords)
+    frac = coords - low
+    low = np.clip(low.astype(int), 0, n - 1)
+    high = np.clip(low + 1, 0, n - 1)
+    interp = np.zeros((m, n))
+    np.add.at(interp, (np.arange(m), low), 1 - frac)
+    np.add.at(interp, (np.arange(m), high), frac)
+
+    return interp @ blur
+
+
+class FramePreprocessor:
+    """
+    Down samples GRAY8 frames of shape src_shape = (H, W) to resolution = (h, w),
+    returning float32 arrays of shape (1, h, w) with values in [0, 1].
+
+    Integer ratios are handled with a block average. Other ratios apply two
+    precomputed resampling matrices that reproduce skimage.transform.resize.
+    All intermediates are preallocated, the result is written into out.
+    """
+
+    def __init__(self, src_shape, resolution):
+        self.src_shape = tuple(src_shape)
+        self.resolution = tuple(resolution)
+        src_h, src_w = self.src_shape
+        h, w = self.resolution
+
+        self.block = src_h % h == 0 and src_w % w == 0
+        if self.block:
+            self._block_shape = (h, src_h // h, w, src_w // w)
+            self._scale = np.float32(1.0 / (255.0 * (src_h // h) * (src_w // w)))
+        else:
+            # the 1/255 normalisation is folded into the row matrix
+            self._rows = (resize_matrix(src_h, h) / 255.0).astype(np.float32)
+            self._cols = np.ascontiguousarray(resize_matrix(src_w, w).T.astype(np.float32))
+            self._src = np.empty(self.src_shape, dtype=np.float32)
+            self._tmp = np.empty((h, src_w), dtype=np.float32)
+
+    def __call__(self, img, out=None):
+        if out is None:
+            out = np.empty((1,) + self.resolution, dtype=np.float32)
+
+        if self.block:
+            np.sum(img.reshape(self._block_shape), axis=(1, 3), dtype=np.float32, out=out[0])
+            out *= self._scale
+        else:
+            np.copyto(self._src, img)
+            np.matmul(self._rows, self._src, out=self._tmp)
+            np.matmul(self._tmp, self._cols, out=out[0])
+
+        return out
+
+
+class LabelDownsampler:
+    """
+    Down samples uint8 label buffers of shape src_shape = (H, W) to
+    resolution = (h, w) by taking the pixel at the centre of each block,
+    labels are object ids, averaging them would mix up objects. Returns
+    uint8 arrays of shape (1, h, w), written into out if given.
+    """
+
+    def __init__(self, src_shape, resolution):
+        self.src_shape = tuple(src_shape)
+        self.resolution = tuple(resolution)
+        (src_h, src_w), (h, w) = self.src_shape, self.resolution
+        self._rows = ((np.arange(h) + 0.5) * src_h / h).astype(np.intp)
+        self._cols = ((np.arange(w) + 0.5) * src_w / w).astype(np.intp)
+        self._tmp = np.empty((h, src_w), dtype=np.uint8)
+
+    def __call__(self, img, out=None):
+        if out is None:
+            out = np.empty((1,) + self.resolution, dtype=np.uint8)
+        np.take(img, self._rows, axis=0, out=self._tmp)
+        np.take(self._tmp, self._cols, axis=1, out=out[0])
+        return out
@@ -0,0 +1,115 @@
+import copy
+import io
+import warnings
+
+import torch
+import torch.nn as nn
+from torch.ao.quantization import DeQuantStub, QuantStub, convert, fuse_modules, get_default_qconfig, prepare
+
+from inference import FusedDuelQNet
+
+
+def default_engine():
+    """Best quantized backend of this torch build for the CPU"""
+    engines = torch.backends.quantized.supported_engines
+    # qnnpack has the lowest overhead on a network this small at the batch
+    # sizes of acting, see benchmarks/bench_quantization.py
+    for engine in ("qnnpack", "x86", "fbgemm"):
+        if engine in engines:
+            return engine
+    raise RuntimeError("This torch build has no quantized CPU backend")
+
+
+def replay_states(memory, count):
+    """count states drawn uniformly from a replay memory, as a float tensor"""
+    # uniformly even for prioritized replay, whose sampling would also anneal beta
+    memory = getattr(memory, "buffer", memory)
+    return memory.gather(memory.sample_indices(count)).states
+
+
+class QuantizableDuelQNet(nn.Module):
+    """
+    FusedDuelQNet between quant / dequant stubs, ready for eager mode static
+    quantization. The convs and heads run in int8, the dueling sum in float.
+    """
+
+    def __init__(self, fused):
+        super().__init__()
+        self.quant = QuantStub()
+        self.convs = copy.deepcopy(fused.convs)
+        self.state_fc = copy.deepcopy(fused.state_fc)
+        self.advantage_fc = copy.deepcopy(fused.advantage_fc)
+        self.dequant_value = DeQuantStub()
+        self.dequant_advantage = DeQuantStub()
+        self.num_features = fused.num_features
+        self.value_features = fused.value_features
+
+    def fuse(self):
+        """Fuses each conv and linear layer with the ReLU after it"""
+        for layers in (self.convs, self.state_fc, self.advantage_fc):
+            pairs = [
+                [str(i), str(i + 1)]
+                for i in range(len(layers) - 1)
+                if isinstance(layers[i + 1], nn.ReLU)
+            ]
+            if pairs:
+                fuse_modules(layers, pairs, inplace=True)
+
+    def forward(self, x):
+        x = self.quant(x)
+        x = self.convs(x).reshape(-1, self.num_features)
+        state_value = self.dequant_value(self.state_fc(x[:, :self.value_features].contiguous()))
+        advantage_values = self.dequant_advantage(self.advantage_fc(x[:, self.value_features:].contiguous()))
+        return state_value + advantage_values - advantage_values.mean(dim=1, keepdim=True)
+
+
+class QuantizedQNet:
+    """
+    Int8 copy of a DuelQNet for acting on CPU, calibrated on calibration_states
+    (e.g. from replay_states). It is a snapshot, build a new one once the
+    weights of q_net have changed enough. It pickles through torch.jit.save,
+    so it can be sent to another process (e.g. an AsyncEvaluator).
+    """
+
+    def __init__(self, q_net, calibration_states, engine=None, batch_size=256):
+        self.engine = engine or default_engine()
+        torch.backends.quantized.engine = self.engine
+
+        model = QuantizableDuelQNet(FusedDuelQNet(q_net).cpu())
+        model.eval()
+        model.fuse()
+        model.qconfig = get_default_qconfig(self.engine)
+        prepare(model, inplace=True)
+        with torch.no_grad():
+            for states in calibration_states.cpu().split(batch_size):
+                model(states)
+        convert(model, inplace=True)
+        with warnings.catch_warnings():
+            # scripting removes most of the per-op overhead at batch size 1
+            warnings.simplefilter("ignore", FutureWarning)
+            self.model = torch.jit.script(model)
+
+    def __getstate__(self):
+        buffer = io.BytesIO()
+        torch.jit.save(self.model, buffer)
+        return {"engine": self.engine, "model": buffer.getvalue()}
+
+    def __setstate__(self, state):
+        self.engine = state["engine"]
+        torch.backends.quantized.engine = self.engine
+        self.model = torch.jit.load(io.BytesIO(state["model"]))
+
+    def __call__(self, states):
+        with torch.inference_mode():
+            return self.model(states.cpu())
+
+    def agreement(self, q_net, states):
+        """
+        Fraction of states on which the greedy actions of the int8 and float32
+        (eval mode) nets agree, and the largest absolute difference in Q values
+        """
+        with torch.inference_mode():
+            float_q_values = FusedDuelQNet(q_net).cpu()(states.cpu())
+            int8_q_values = self(states)
+        agreement = (float_q_values.argmax(dim=1) == int8_q_values.argmax(dim=1)).float().mean().item()
+        return agreement, (float_q_values - int8_q_values).abs().max().item()
@@ -0,0 +1,671 @@
+import json
+import os
+from collections import namedtuple
+
+import numpy as np
+import torch
+
+from sum_tree import SumTree
+
+
+# indices are the buffer slots of the sampled transitions, weights the
+# importance-sampling weights (None unless sampled by priority) and discounts
+# the discount**k to apply to the value of next_states (None unless n_step > 1,
+# rewards then being the discounted sums of up to n_step rewards)
+Batch = namedtuple(
+    "Batch",
+    ["states", "actions", "rewards", "next_states", "dones", "indices", "weights", "discounts"],
+    defaults=(None, None, None),
+)
+
+
+def _read_meta(storage_dir):
+    with open(os.path.join(storage_dir, "meta.json"), "r") as f:
+        return json.load(f)
+
+
+def _write_meta(storage_dir, meta):
+    # written to a temporary file first so readers never see a partial file
+    path = os.path.join(storage_dir, "meta.json")
+    with open(path + ".tmp", "w") as f:
+        json.dump(meta, f, indent=4)
+    os.replace(path + ".tmp", path)
+
+
+def _frames_to_tensor(frames, device):
+    frames = torch.from_numpy(frames).to(device, non_blocking=True)
+    return frames.float().div_(255.0)
+
+
+def _batch_from_arrays(arrays, indices, device, out=None):
+    """
+    Batch of torch tensors on device built from the sampled numpy arrays
+    (states, actions, rewards, next_states, dones[, discounts]), or copied
+    into the preallocated tensors of the Batch out.
+    """
+    states, actions, rewards, next_states, dones = arrays[:5]
+    discounts = arrays[5] if len(arrays) > 5 else None
+    if out is None:
+        return Batch(
+            states=_frames_to_tensor(states, device),
+            actions=torch.from_numpy(actions).to(device),
+            rewards=torch.from_numpy(rewards).to(device),
+            next_states=_frames_to_tensor(next_states, device),
+            dones=torch.from_numpy(dones).to(device),
+            indices=indices,
+            discounts=None if discounts is None else torch.from_numpy(discounts).to(device),
+        )
+
+    out.states.copy_(torch.from_numpy(states)).div_(255.0)
+    out.actions.copy_(torch.from_numpy(actions))
+    out.rewards.copy_(torch.from_numpy(rewards))
+    out.next_states.copy_(torch.from_numpy(next_states)).div_(255.0)
+    out.dones.copy_(torch.from_numpy(dones))
+    if discounts is not None:
+        out.discounts.copy_(torch.from_numpy(discounts))
+    return out._replace(indices=indices)
+
+
+def quantize_frames(frames, out):
+    """Writes float frames with values in [0, 1] into the uint8 array out"""
+    np.rint(np.multiply(frames, 255.0, dtype=np.float32), out=out, casting="unsafe")
+    return out
+
+
+class ReplayBuffer:
+    """
+    Fixed size circular replay memory backed by preallocated arrays.
+
+    Frames are stored as uint8 (states are floats in [0, 1] from DoomEnv),
+    actions as int64, rewards as float32 and dones as bool. Appending is O(1),
+    sampling gathers a batch with one fancy index per array and returns torch
+    tensors on device.
+
+    With a storage_dir the arrays are memory-mapped .npy files in that
+    directory, so the buffer can be larger than RAM and survives the process.
+    mode is "w+" to create a new buffer, "r+" to reopen one and keep appending
+    to it and "r" to read one another process is filling (see
+    open_replay_buffer). The buffer position is only written by flush().
+
+    With n_step > 1 each transition also holds its n-step return, updated
+    incrementally as the following transitions of its episode are appended:
+    the discounted sum of up to n_step rewards, the transition whose next
+    state bootstraps it and the matching discount**k. Transitions of one
+    trajectory must then be appended in order.
+    """
+
+    kind = "transitions"
+
+    def __init__(
+        self, capacity, state_shape, device="cpu", storage_dir=None, mode="w+", n_step=1, discount=0.99
+    ):
+        self.capacity = capacity
+        self.state_shape = tuple(state_shape)
+        self.device = torch.device(device)
+        self.storage_dir = storage_dir
+        self.mode = mode
+        self.n_step = n_step
+        self.discount = discount
+
+        self.states = self._allocate("states", (capacity,) + self.state_shape, np.uint8)
+        self.next_states = self._allocate("next_states", (capacity,) + self.state_shape, np.uint8)
+        self.actions = self._allocate("actions", (capacity,), np.int64)
+        self.rewards = self._allocate("rewards", (capacity,), np.float32)
+        self.dones = self._allocate("dones", (capacity,), np.bool_)
+        self._allocate_n_step()
+
+        self.cursor = 0
+        self.size = 0
+        # slots the last append made unsampleable, only FrameReplayBuffer has any
+        self.invalidated = []
+        self._open_storage()
+
+    def __len__(self):
+        return self.size
+
+    def _allocate(self, name, shape, dtype):
+        """Zeroed in-memory array, or a memory-mapped .npy file under storage_dir"""
+        if self.storage_dir is None:
+            return np.zeros(shape, dtype=dtype)
+
+        path = os.path.join(self.storage_dir, name + ".npy")
+        if self.mode == "w+":
+            # the file is created sparse, pages only take disk space once written
+            os.makedirs(self.storage_dir, exist_ok=True)
+            return np.lib.format.open_memmap(path, mode="w+", dtype=dtype, shape=shape)
+        return np.lib.format.open_memmap(path, mode=self.mode)
+
+    def _allocate_n_step(self):
+        if self.n_step > 1:
+            self.returns = self._allocate("returns", (self.capacity,), np.float32)
+            self.discounts = self._allocate("discounts", (self.capacity,), np.float32)
+            self.bootstrap = self._allocate("bootstrap", (self.capacity,), np.int64)
+            self.n_step_dones = self._allocate("n_step_dones", (self.capacity,), np.bool_)
+        # the last n_step - 1 transitions of the current episode, oldest first
+        self._window = []
+
+    def _update_n_step(self, index, reward, done, continues):
+        """Adds the reward of transition index to the n-step returns of the transitions before it"""
+        if self.n_step == 1:
+            return
+        if not continues:
+            self._window = []
+
+        window = np.array(self._window, dtype=np.int64)
+        ages = np.arange(len(window), 0, -1)
+        self.returns[window] += (self.discount ** ages * reward).astype(np.float32)
+        self.discounts[window] = self.discount ** (ages + 1)
+        self.bootstrap[window] = index
+        self.n_step_dones[window] = done
+
+        self.returns[index] = reward
+        self.discounts[index] = self.discount
+        self.bootstrap[index] = index
+        self.n_step_dones[index] = done
+
+        # transitions leave the window once they hold n_step rewards
+        self._window = [] if done else (self._window + [index])[-(self.n_step - 1):]
+
+    def _returns(self, indices):
+        """rewards, dones and the transitions whose next state bootstraps the sampled ones"""
+        if self.n_step == 1:
+            return self.rewards[indices], self.dones[indices], indices
+        return self.returns[indices], self.n_step_dones[indices], self.bootstrap[indices]
+
+    def _open_storage(self):
+        if self.storage_dir is None:
+            return
+        if self.mode == "w+":
+            self.flush()
+        else:
+            self.refresh()
+
+    def _meta(self):
+        return {
+            "kind": self.kind,
+            "capacity": self.capacity,
+            "state_shape": list(self.state_shape),
+            "cursor": self.cursor,
+            "size": self.size,
+            "n_step": self.n_step,
+            "discount": self.discount,
+            "n_step_window": [int(i) for i in self._window],
+        }
+
+    def _load_meta(self, meta):
+        self.cursor = meta["cursor"]
+        self.size = meta["size"]
+        self._window = meta["n_step_window"]
+
+    def flush(self):
+        """Writes the memory-mapped arrays and the buffer position to storage_dir"""
+        if self.storage_dir is None or self.mode == "r":
+            return
+        for array in vars(self).values():
+            if isinstance(array, np.memmap):
+                array.flush()
+        _write_meta(self.storage_dir, self._meta())
+
+    def refresh(self):
+        """Re-reads the buffer position, for readers of a buffer another process is filling"""
+        if self.storage_dir is not None:
+            self._load_meta(_read_meta(self.storage_dir))
+
+    def sampleable_slots(self):
+        return np.arange(self.size)
+
+    def append(self, state, action, reward, next_state, done, stream=0):
+        """
+        Stores one transition, overwriting the oldest one when full. Returns its index.
+        stream is only used by ShardedReplayBuffer.
+        """
+        index = self.cursor
+        quantize_frames(state, self.states[index])
+        quantize_frames(next_state, self.next_states[index])
+        self.actions[index] = action
+        self.rewards[index] = reward
+        self.dones[index] = done
+
+        if self.n_step > 1:
+            continues = bool(self._window) and np.array_equal(
+                self.states[index], self.next_states[self._window[-1]]
+            )
+            self._update_n_step(index, reward, done, continues)
+
+        self.cursor = (index + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+        return index
+
+    def sample_indices(self, batch_size):
+        return np.random.randint(0, self.size, size=batch_size)
+
+    def sample(self, batch_size, out=None):
+        """Uniformly sampled Batch, written into the tensors of out if given"""
+        return self.gather(self.sample_indices(batch_size), out)
+
+    def gather_arrays(self, indices):
+        rewards, dones, bootstrap = self._returns(indices)
+        arrays = (
+            self.states[indices],
+            self.actions[indices],
+            rewards,
+            self.next_states[bootstrap],
+            dones,
+        )
+        if self.n_step > 1:
+            arrays += (self.discounts[indices],)
+        return arrays
+
+    def gather(self, indices, out=None):
+        return _batch_from_arrays(self.gather_arrays(indices), indices, self.device, out)
+
+
+class FrameReplayBuffer(ReplayBuffer):
+    """
+    Replay memory storing every observation once, as a single uint8 frame.
+
+    Frame i is the state of transition i and, unless transition i ended the
+    episode, frame i + 1 is its next state, so next_state (and stacks of the
+    last frame_stack frames) are rebuilt from frame indices at sample time.
+    Frames that belong to a previous episode are zeroed in stacks, and next
+    states of terminal transitions are all zeros.
+
+    Transitions must be appended in trajectory order. When a new state does
+    not continue the previous next_state without a done in between (e.g. an
+    env reset at an epoch boundary), one slot is left as an unsampled gap
+    holding that next_state.
+    """
+
+    kind = "frames"
+
+    def __init__(
+        self,
+        capacity,
+        state_shape,
+        device="cpu",
+        frame_stack=1,
+        storage_dir=None,
+        mode="w+",
+        n_step=1,
+        discount=0.99,
+    ):
+        self.capacity = capacity
+        self.state_shape = tuple(state_shape)
+        self.frame_shape = (1,) + self.state_shape[1:]
+        self.frame_stack = frame_stack
+        self.device = torch.device(device)
+        self.storage_dir = storage_dir
+        self.mode = mode
+        self.n_step = n_step
+        self.discount = discount
+
+        self.frames = self._allocate("frames", (capacity,) + self.frame_shape, np.uint8)
+        self.actions = self._allocate("actions", (capacity,), np.int64)
+        self.rewards = self._allocate("rewards", (capacity,), np.float32)
+        self.dones = self._allocate("dones", (capacity,), np.bool_)
+        # first transition of an episode, stacks never reach past it
+        self.episode_starts = self._allocate("episode_starts", (capacity,), np.bool_)
+        # gaps and the slot holding the pending next frame can't be sampled
+        self.valid = self._allocate("valid", (capacity,), np.bool_)
+        self._allocate_n_step()
+
+        self._frame = np.zeros(self.frame_shape, dtype=np.uint8)
+        self._pending_next = False
+
+        self.cursor = 0
+        self.size = 0
+        self.invalidated = []
+        self._open_storage()
+
+    def _meta(self):
+        meta = super()._meta()
+        meta["frame_stack"] = self.frame_stack
+        meta["pending_next"] = self._pending_next
+        return meta
+
+    def _load_meta(self, meta):
+        super()._load_meta(meta)
+        self._pending_next = meta["pending_next"]
+
+    def sampleable_slots(self):
+        return np.flatnonzero(self.valid[:self.size])
+
+    def _advance(self):
+        self.cursor = (self.cursor + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    def append(self, state, action, reward, next_state, done, stream=0):
+        frame = quantize_frames(state[-1:], self._frame)
+        self.invalidated = []
+
+        continues = self._pending_next and np.array_equal(frame, self.frames[self.cursor])
+        if self._pending_next and not continues:
+            # the slot keeps the previous transition's next frame
+            self.valid[self.cursor] = False
+            self.episode_starts[self.cursor] = False
+            self.invalidated.append(self.cursor)
+            self._advance()
+
+        index = self.cursor
+        self.frames[index] = frame
+        self.actions[index] = action
+        self.rewards[index] = reward
+        self.dones[index] = done
+        self.episode_starts[index] = not continues
+        self.valid[index] = True
+        self._update_n_step(index, reward, done, continues)
+        self._advance()
+
+        self._pending_next = not done
+        if not done:
+            # overwrites the oldest transition once the buffer is full
+            quantize_frames(next_state[-1:], self.frames[self.cursor])
+            self.valid[self.cursor] = False
+            self.episode_starts[self.cursor] = False
+            self.invalidated.append(self.cursor)
+
+        return index
+
+    def sample_indices(self, batch_size):
+        indices = np.random.randint(0, self.size, size=batch_size)
+        invalid = ~self.valid[indices]
+        while invalid.any():
+            indices[invalid] = np.random.randint(0, self.size, size=invalid.sum())
+            invalid = ~self.valid[indices]
+        return indices
+
+    def _stack_frames(self, last, allowed):
+        """
+        Gathers frames last - frame_stack + 1 ... last for each index in last,
+        zeroing the ones from before an episode start. allowed masks out whole
+        rows (terminal next states).
+        """
+        k = self.frame_stack
+        offsets = np.arange(k)
+        positions = (last[:, None] - offsets[None, :]) % self.capacity
+
+        # oldest stored transition, the stack can't reach past it either. Once
+        # full, it's at cursor, or at cursor + 1 while cursor holds the
+        # pending next frame of the last transition
+        if self.size < self.capacity:
+            oldest = 0
+        elif self._pending_next:
+            oldest = (self.cursor + 1) % self.capacity
+        else:
+            oldest = self.cursor
+        starts = self.episode_starts[positions] | (positions == oldest)
+        # frame last - o is kept iff no episode starts at last - o + 1 ... last
+        blocked = np.zeros_like(starts)
+        blocked[:, 1:] = np.logical_or.accumulate(starts[:, :-1], axis=1)
+        keep = ~blocked & allowed[:, None]
+
+        frames = self.frames[positions[:, ::-1], 0]
+        frames *= keep[:, ::-1, None, None]
+        return frames
+
+    def gather_arrays(self, indices):
+        rewards, dones, bootstrap = self._returns(indices)
+        next_indices = (bootstrap + 1) % self.capacity
+        everything = np.ones(len(indices), dtype=np.bool_)
+
+        if self.frame_stack == 1:
+            states = self.frames[indices]
+            next_states = self.frames[next_indices]
+            next_states *= ~dones[:, None, None, None]
+        else:
+            states = self._stack_frames(indices, everything)
+            next_states = self._stack_frames(next_indices, ~dones)
+
+        arrays = (states, self.actions[indices], rewards, next_states, dones)
+        if self.n_step > 1:
+            arrays += (self.discounts[indices],)
+        return arrays
+
+
+class ShardedReplayBuffer:
+    """
+    Splits the replay memory into one shard per stream of transitions (one
+    per env of a VecDoomEnv pool), so each shard receives a single trajectory
+    in order. Uniform batches are drawn from all shards proportionally to
+    their size. Slot indices are global, shard i owning
+    [i * shard_capacity, (i + 1) * shard_capacity).
+    """
+
+    def __init__(self, shards, storage_dir=None):
+        self.shards = shards
+        self.shard_capacity = shards[0].capacity
+        self.capacity = self.shard_capacity * len(shards)
+        self.device = shards[0].device
+        self.storage_dir = storage_dir
+        self.invalidated = []
+        if storage_dir is not None and shards[0].mode == "w+":
+            _write_meta(storage_dir, {"kind": "sharded", "num_shards": len(shards)})
+
+    def __len__(self):
+        return sum(len(shard) for shard in self.shards)
+
+    def flush(self):
+        for shard in self.shards:
+            shard.flush()
+
+    def refresh(self):
+        for shard in self.shards:
+            shard.refresh()
+
+    def sampleable_slots(self):
+        return np.concatenate([
+            shard.sampleable_slots() + i * self.shard_capacity
+            for i, shard in enumerate(self.shards)
+        ])
+
+    def append(self, state, action, reward, next_state, done, stream=0):
+        shard = self.shards[stream]
+        offset = stream * self.shard_capacity
+        index = shard.append(state, action, reward, next_state, done)
+        self.invalidated = [offset + i for i in shard.invalidated]
+        return offset + index
+
+    def sample_indices(self, batch_size):
+        sizes = np.array([len(shard) for shard in self.shards], dtype=np.float64)
+        counts = np.random.multinomial(batch_size, sizes / sizes.sum())
+        return np.concatenate([
+            shard.sample_indices(count) + i * self.shard_capacity
+            for i, (shard, count) in enumerate(zip(self.shards, counts))
+            if count > 0
+        ])
+
+    def sample(self, batch_size, out=None):
+        return self.gather(self.sample_indices(batch_size), out)
+
+    def gather_arrays(self, indices):
+        shard_ids = indices // self.shard_capacity
+        order = np.argsort(shard_ids, kind="stable")
+        sorted_ids = shard_ids[order]
+        bounds = np.flatnonzero(np.diff(sorted_ids)) + 1
+
+        parts = [
+            self.shards[ids[0]].gather_arrays(local)
+            for ids, local in zip(
+                np.split(sorted_ids, bounds),
+                np.split(indices[order] % self.shard_capacity, bounds),
+            )
+        ]
+        # back to the order of indices
+        inverse = np.argsort(order)
+        return tuple(np.concatenate(field)[inverse] for field in zip(*parts))
+
+    def gather(self, indices, out=None):
+        return _batch_from_arrays(self.gather_arrays(indices), indices, self.device, out)
+
+
+class PrioritizedReplayBuffer:
+    """
+    Proportional prioritized experience replay (https://arxiv.org/abs/1511.05952)
+    on top of any of the buffers above, which keep storing the transitions.
+
+    New transitions get the highest priority seen so far. Batches are sampled
+    from a SumTree over the buffer slots and carry importance-sampling weights,
+    beta being annealed linearly from beta to 1 over beta_steps samples.
+    """
+
+    def __init__(self, buffer, alpha=0.6, beta=0.4, beta_steps=100000, epsilon=1e-6):
+        self.buffer = buffer
+        self.capacity = buffer.capacity
+        self.device = buffer.device
+        self.alpha = alpha
+        self.beta = beta
+        self.beta_increment = (1.0 - beta) / max(1, beta_steps)
+        self.epsilon = epsilon
+
+        self.tree = SumTree(buffer.capacity)
+        self.max_priority = 1.0
+        if len(buffer) > 0:
+            # reopened from disk, priorities aren't stored so start them all equal
+            self.tree.update(buffer.sampleable_slots(), self.max_priority ** alpha)
+
+    def __len__(self):
+        return len(self.buffer)
+
+    def flush(self):
+        self.buffer.flush()
+
+    def refresh(self):
+        self.buffer.refresh()
+
+    def append(self, state, action, reward, next_state, done, stream=0):
+        index = self.buffer.append(state, action, reward, next_state, done, stream)
+        self.tree.update([index], self.max_priority ** self.alpha)
+        if self.buffer.invalidated:
+            self.tree.update(self.buffer.invalidated, 0.0)
+        return index
+
+    def sample(self, batch_size, out=None):
+        indices = self.tree.sample(batch_size)
+
+        probabilities = self.tree.get(indices) / self.tree.total
+        weights = (len(self.buffer) * probabilities) ** -self.beta
+        weights /= weights.max()
+        weights = torch.from_numpy(weights.astype(np.float32))
+        self.beta = min(1.0, self.beta + self.beta_increment)
+
+        batch = self.buffer.gather(indices, out)
+        if out is None:
+            return batch._replace(weights=weights.to(self.device))
+        out.weights.copy_(weights)
+        return batch._replace(weights=out.weights)
+
+    def update_priorities(self, indices, td_errors):
+        priorities = np.abs(td_errors) + self.epsilon
+        self.max_priority = max(self.max_priority, priorities.max())
+        self.tree.update(indices, priorities ** self.alpha)
+
+
+def create_replay_buffer(
+    storage,
+    capacity,
+    state_shape,
+    device="cpu",
+    frame_stack=1,
+    num_streams=1,
+    prioritized=False,
+    priority_alpha=0.6,
+    priority_beta=0.4,
+    priority_beta_steps=100000,
+    storage_dir=None,
+    n_step=1,
+    discount=0.99,
+):
+    """
+    Builds the replay memory selected by the replay_storage and prioritized_replay
+    config keys, memory-mapped under storage_dir if given.
+    """
+    if prioritized:
+        buffer = create_replay_buffer(
+            storage,
+            capacity,
+            state_shape,
+            device,
+            frame_stack,
+            num_streams,
+            storage_dir=storage_dir,
+            n_step=n_step,
+            discount=discount,
+        )
+        return PrioritizedReplayBuffer(
+            buffer, alpha=priority_alpha, beta=priority_beta, beta_steps=priority_beta_steps
+        )
+
+    if num_streams > 1:
+        shard_capacity = capacity // num_streams
+        shards = []
+        for i in range(num_streams):
+            shard_dir = None if storage_dir is None else os.path.join(storage_dir, f"shard_{i}")
+            shards.append(create_replay_buffer(
+                storage,
+                shard_capacity,
+                state_shape,
+                device,
+                frame_stack,
+                storage_dir=shard_dir,
+                n_step=n_step,
+                discount=discount,
+            ))
+        return ShardedReplayBuffer(shards, storage_dir=storage_dir)
+
+    if storage == "transitions":
+        return ReplayBuffer(
+            capacity,
+            state_shape,
+            device=device,
+            storage_dir=storage_dir,
+            n_step=n_step,
+            discount=discount,
+        )
+    if storage == "frames":
+        return FrameReplayBuffer(
+            capacity,
+            state_shape,
+            device=device,
+            frame_stack=frame_stack,
+            storage_dir=storage_dir,
+            n_step=n_step,
+            discount=discount,
+        )
+    raise ValueError(f"Unknown replay storage: {storage}")
+
+
+def open_replay_buffer(storage_dir, device="cpu", mode="r+"):
+    """
+    Reopens a buffer created with a storage_dir, to resume appending to it
+    (mode "r+") or to sample from it read-only (mode "r"), e.g. from another
+    process while the one filling it keeps running.
+    """
+    meta = _read_meta(storage_dir)
+
+    if meta["kind"] == "sharded":
+        shards = [
+            open_replay_buffer(os.path.join(storage_dir, f"shard_{i}"), device, mode)
+            for i in range(meta["num_shards"])
+        ]
+        return ShardedReplayBuffer(shards, storage_dir=storage_dir)
+
+    if meta["kind"] == "frames":
+        return FrameReplayBuffer(
+            meta["capacity"],
+            meta["state_shape"],
+            device=device,
+            frame_stack=meta["frame_stack"],
+            storage_dir=storage_dir,
+            mode=mode,
+            n_step=meta["n_step"],
+            discount=meta["discount"],
+        )
+    return ReplayBuffer(
+        meta["capacity"],
+        meta["state_shape"],
+        device=device,
+        storage_dir=storage_dir,
+        mode=mode,
+        n_step=meta["n_step"],
+        discount=meta["discount"],
+    )
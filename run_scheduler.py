@@ -0,0 +1,126 @@
+import multiprocessing as mp
+import os
+import sys
+import traceback
+from collections import namedtuple
+from multiprocessing.connection import wait
+from time import time
+
+import torch
+
+
+# outcome of one run: exitcode is 0 if it returned, 1 if it raised and the
+# exit code of its worker if that died, result what its target returned and
+# error the traceback if it failed
+RunResult = namedtuple("RunResult", ["name", "run_dir", "exitcode", "result", "error", "elapsed"])
+
+
+def _run_worker(num_threads, conn):
+    """Runs the runs sent over conn one after the other, until it receives None"""
+    # each worker gets its own share of the cores instead of all of them
+    torch.set_num_threads(num_threads)
+    stdout, stderr = sys.stdout, sys.stderr
+    for run_dir, target, args in iter(conn.recv, None):
+        # the run's logger: everything it prints goes to its own log file
+        log = open(os.path.join(run_dir, "output.log"), "a", buffering=1)
+        sys.stdout = sys.stderr = log
+        try:
+            result, error = target(*args), None
+        except Exception:
+            traceback.print_exc()
+            result, error = None, traceback.format_exc()
+        finally:
+            sys.stdout, sys.stderr = stdout, stderr
+            log.close()
+        conn.send((result, error))
+
+
+class RunScheduler:
+    """
+    Runs submitted training runs in worker processes, at most max_concurrent
+    at a time. Each run prints to output.log in its own run directory and
+    gets num_threads torch intra-op threads, by default an even share of the
+    cores between the concurrent runs so they don't oversubscribe them.
+
+    A worker takes the next pending run once its current one is done, so
+    whatever a run leaves in its process, e.g. the Doom games of the
+    DoomEnvPool of multi_run, is there for the next one. A worker that dies
+    fails its run and is replaced. Targets and their arguments must be
+    picklable, workers are spawned.
+    """
+
+    def __init__(self, max_concurrent, num_threads=None):
+        self.max_concurrent = max(1, max_concurrent)
+        self.num_threads = num_threads or max(1, (os.cpu_count() or 1) // self.max_concurrent)
+        self.ctx = mp.get_context("spawn")
+        self.pending = []
+
+    def submit(self, name, run_dir, target, *args):
+        """Queues target(*args) as run name, logging to run_dir"""
+        os.makedirs(run_dir, exist_ok=True)
+        self.pending.append((name, run_dir, target, args))
+
+    def _start_worker(self):
+        conn, child_conn = self.ctx.Pipe()
+        # not a daemon, runs may start processes of their own (env pools, actors)
+        process = self.ctx.Process(target=_run_worker, args=(self.num_threads, child_conn))
+        process.start()
+        child_conn.close()
+        return {"process": process, "conn": conn, "run": None}
+
+    def _assign(self, worker, name, run_dir, target, args):
+        worker["conn"].send((run_dir, target, args))
+        worker["run"] = {"name": name, "run_dir": run_dir, "start": time()}
+        print(f"Started run {name} (pid {worker['process'].pid}, {self.num_threads} threads), "
+              f"logging to {run_dir}/output.log")
+
+    def _finish(self, worker, exitcode, result, error):
+        run = worker["run"]
+        worker["run"] = None
+        result = RunResult(run["name"], run["run_dir"], exitcode, result, error, time() - run["start"])
+        status = "done" if exitcode == 0 else "FAILED"
+        print(f"Run {result.name} {status} in {result.elapsed / 60:.2f} minutes")
+        return result
+
+    def run(self):
+        """Runs every submitted run and returns their RunResults, in submission order"""
+        order = [name for name, *_ in self.pending]
+        workers = []
+        results = {}
+        try:
+            while self.pending or any(worker["run"] for worker in workers):
+                for worker in workers:
+                    if worker["run"] is None and self.pending:
+                        self._assign(worker, *self.pending.pop(0))
+                while self.pending and len(workers) < self.max_concurrent:
+                    workers.append(self._start_worker())
+                    self._assign(workers[-1], *self.pending.pop(0))
+
+                busy = [worker for worker in workers if worker["run"]]
+                ready = wait([worker["conn"] for worker in busy] + [worker["process"].sentinel for worker in busy])
+                for worker in busy:
+                    if worker["conn"] in ready:
+                        try:
+                            result, error = worker["conn"].recv()
+                            run_result = self._finish(worker, 0 if error is None else 1, result, error)
+                            results[run_result.name] = run_result
+                            continue
+                        except EOFError:
+                            pass
+                    if worker["conn"] in ready or worker["process"].sentinel in ready:
+                        # died during the run, without reporting
+                        worker["process"].join()
+                        exitcode = worker["process"].exitcode
+                        run_result = self._finish(worker, exitcode, None, f"worker exited with code {exitcode}")
+                        results[run_result.name] = run_result
+                        worker["conn"].close()
+                        workers.remove(worker)
+        finally:
+            for worker in workers:
+                try:
+                    worker["conn"].send(None)
+                except OSError:
+                    pass
+            for worker in workers:
+                worker["process"].join()
+        return [results[name] for name in order]
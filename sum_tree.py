@@ -0,0 +1,59 @@
+import numpy as np
+
+
+class SumTree:
+    """
+    Binary sum tree over capacity leaf priorities, stored as a flat array heap
+    (root at 1, children of node i at 2i and 2i + 1, leaves from leaf_offset on).
+
+    Updates and sampling are batched: each walks the tree one level at a time
+    for the whole batch, so a call costs O(log n) NumPy operations whatever
+    the batch size.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.depth = max(1, int(np.ceil(np.log2(capacity))))
+        self.leaf_offset = 2 ** self.depth
+        self.nodes = np.zeros(2 * self.leaf_offset, dtype=np.float64)
+
+    @property
+    def total(self):
+        return self.nodes[1]
+
+    def get(self, indices):
+        return self.nodes[np.asarray(indices) + self.leaf_offset]
+
+    def update(self, indices, priorities):
+        """Sets the priorities of the leaves at indices and refreshes their ancestors"""
+        positions = np.asarray(indices, dtype=np.int64) + self.leaf_offset
+        self.nodes[positions] = priorities
+
+        positions = np.unique(positions // 2)
+        while positions[0] > 0:
+            # parents are recomputed from their children rather than adjusted
+            # by deltas, so float errors don't accumulate over millions of updates
+            self.nodes[positions] = self.nodes[2 * positions] + self.nodes[2 * positions + 1]
+            positions = np.unique(positions // 2)
+
+    def find(self, values):
+        """Index of the leaf whose cumulative priority interval contains each value"""
+        values = np.array(values, dtype=np.float64)
+        positions = np.ones(len(values), dtype=np.int64)
+        for _ in range(self.depth):
+            left = 2 * positions
+            left_sums = self.nodes[left]
+            # never step into an empty subtree, float rounding can leave
+            # values a hair above the left sum next to a zero right sibling
+            go_right = (values >= left_sums) & (self.nodes[left + 1] > 0)
+            values -= left_sums * go_right
+            positions = left + go_right
+        return positions - self.leaf_offset
+
+    def sample(self, batch_size):
+        """Stratified proportional sampling, one draw per equal slice of the total"""
+        segment = self.total / batch_size
+        values = (np.arange(batch_size) + np.random.uniform(size=batch_size)) * segment
+        # rounding could push a value past the last non-zero leaf
+        values = np.minimum(values, np.nextafter(self.total, 0))
+        return self.find(values)
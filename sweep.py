@@ -0,0 +1,194 @@
+import datetime
+import fcntl
+import functools
+import itertools as it
+import json
+import math
+import os
+import random
+import sys
+
+import multi_run
+from level_catalog import load_catalog
+from multi_run import AGENT_CONFIG, DictObj, run_series_member
+from run_scheduler import RunScheduler
+
+
+def sample_value(spec, rng):
+    """A value drawn from a parameter spec, {"values": [...]} or {"min": a, "max": b, "log": false}"""
+    if "values" in spec:
+        return rng.choice(spec["values"])
+    low, high = spec["min"], spec["max"]
+    if spec.get("log", False):
+        value = math.exp(rng.uniform(math.log(low), math.log(high)))
+    else:
+        value = rng.uniform(low, high)
+    # integer bounds give integer values, e.g. for batch sizes
+    if isinstance(low, int) and isinstance(high, int):
+        return int(round(value))
+    return value
+
+
+def expand_search_space(parameters, method="grid", num_trials=None, seed=0):
+    """
+    The config overrides of the trials of a sweep over parameters, which maps
+    config keys to parameter specs. A grid sweep takes every combination of
+    the "values" of the specs, a random one num_trials draws of sample_value.
+    """
+    names = sorted(parameters)
+    if method == "grid":
+        for name in names:
+            if "values" not in parameters[name]:
+                raise ValueError(f"Grid sweeps need a list of values for {name}")
+        return [
+            dict(zip(names, values))
+            for values in it.product(*[parameters[name]["values"] for name in names])
+        ]
+    if method == "random":
+        rng = random.Random(seed)
+        return [{name: sample_value(parameters[name], rng) for name in names} for _ in range(num_trials)]
+    raise ValueError(f"Unknown sweep method {method}, expected grid or random")
+
+
+class SuccessiveHalving:
+    """
+    Asynchronous successive halving over the per-epoch train scores of the
+    trials of a sweep. Rungs sit at min_epochs, min_epochs * reduction_factor,
+    min_epochs * reduction_factor ** 2, ... epochs. A trial reaching a rung
+    is promoted to the next one if its score is in the top
+    1 / reduction_factor of the scores recorded at that rung so far, and
+    stopped otherwise, so trials never wait for each other.
+
+    The rungs are kept in rungs.json of the sweep directory, shared by the
+    trial processes under a file lock on rungs.json.lock. Unlike a
+    multiprocessing lock it survives pickling, should_stop is sent to the
+    RunScheduler workers with each trial.
+    """
+
+    def __init__(self, sweep_dir, min_epochs=1, reduction_factor=2):
+        self.path = os.path.join(sweep_dir, "rungs.json")
+        self.lock_path = self.path + ".lock"
+        self.min_epochs = min_epochs
+        self.reduction_factor = reduction_factor
+        with open(self.path, "w") as f:
+            json.dump({}, f)
+
+    def is_rung(self, epochs):
+        rung = self.min_epochs
+        while rung < epochs:
+            rung *= self.reduction_factor
+        return rung == epochs
+
+    def should_stop(self, trial_name, epochs, score):
+        """Records score at the rung of epochs, if any, and returns True if the trial should stop there"""
+        if not self.is_rung(epochs):
+            return False
+        if math.isnan(score):
+            # no episode finished during the epoch, ranks last
+            score = -math.inf
+        with open(self.lock_path, "w") as lock:
+            # released when lock is closed
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            with open(self.path, "r") as f:
+                rungs = json.load(f)
+            scores = rungs.setdefault(str(epochs), {})
+            scores[trial_name] = score
+            with open(self.path, "w") as f:
+                json.dump(rungs, f, indent=4)
+        promoted = math.ceil(len(scores) / self.reduction_factor)
+        rank = sorted(scores.values(), reverse=True).index(score)
+        stop = rank >= promoted
+        print(f"Rung at {epochs} epochs: score {score:.1f} ranks {rank + 1} of {len(scores)}, "
+              + ("stopping" if stop else "promoted"))
+        return stop
+
+
+def run_sweep(sweep_config, agent_config, level_name, sweep_dir):
+    """
+    Runs the trials of sweep_config in parallel, each with agent_config
+    updated by its overrides, pruning them with SuccessiveHalving. Every
+    trial gets a directory in sweep_dir, trials.json there records them all.
+    Returns the trial records, best first.
+    """
+    # before any trial starts, raises if the level can't be played
+    load_catalog()[level_name]
+    os.makedirs(sweep_dir, exist_ok=True)
+    with open(os.path.join(sweep_dir, "sweep_config.json"), "w") as f:
+        json.dump(sweep_config, f, indent=4)
+
+    trials = expand_search_space(
+        sweep_config["parameters"],
+        sweep_config.get("method", "grid"),
+        sweep_config.get("num_trials"),
+        sweep_config.get("seed", 0),
+    )
+    print(f"Sweep of {len(trials)} trials in {sweep_dir}")
+
+    scheduler = RunScheduler(sweep_config.get("concurrent_trials", agent_config.concurrent_runs), agent_config.threads_per_run)
+    pruner = SuccessiveHalving(
+        sweep_dir,
+        min_epochs=sweep_config.get("min_epochs", 1),
+        reduction_factor=sweep_config.get("reduction_factor", 2),
+    )
+    group = os.path.basename(os.path.normpath(sweep_dir))
+    # overrides may include train_epochs, which decides if a trial was pruned
+    trial_configs = [DictObj({**vars(agent_config), **overrides}) for overrides in trials]
+
+    for trial_nb, (overrides, trial_config) in enumerate(zip(trials, trial_configs)):
+        trial_name = f"trial-{trial_nb}"
+        trial_dir = os.path.join(sweep_dir, trial_name)
+        os.makedirs(trial_dir, exist_ok=True)
+        with open(os.path.join(trial_dir, "config.json"), "w") as f:
+            json.dump(vars(trial_config), f, indent=4)
+        scheduler.submit(
+            trial_name,
+            trial_dir,
+            run_series_member,
+            level_name,
+            f"{group}-{trial_name}",
+            group,
+            trial_config,
+            trial_dir,
+            functools.partial(pruner.should_stop, trial_name),
+        )
+
+    records = []
+    for overrides, trial_config, run_result in zip(trials, trial_configs, scheduler.run()):
+        epoch_scores = run_result.result or []
+        records.append({
+            "name": run_result.name,
+            "overrides": overrides,
+            "exitcode": run_result.exitcode,
+            "epochs": len(epoch_scores),
+            "pruned": run_result.exitcode == 0 and len(epoch_scores) < trial_config.train_epochs,
+            "final_train_score": epoch_scores[-1] if epoch_scores else None,
+            "epoch_scores": epoch_scores,
+            "error": run_result.error,
+            "elapsed": run_result.elapsed,
+        })
+
+    # trials run to the end first, then most epochs survived, then the last score
+    def rank_key(record):
+        score = record["final_train_score"]
+        done = record["exitcode"] == 0 and not record["pruned"]
+        return done, record["epochs"], -math.inf if score is None else score
+
+    records.sort(key=rank_key, reverse=True)
+    with open(os.path.join(sweep_dir, "trials.json"), "w") as f:
+        json.dump(records, f, indent=4)
+    return records
+
+
+# e.g. python sweep.py configs/sweep_config.json
+if __name__ == "__main__":
+    with open(sys.argv[1], "r") as f:
+        sweep_config = json.load(f)
+
+    timestamp = datetime.datetime.now().strftime("%m%d-%H%M")
+    sweep_dir = multi_run.save_dir + f"sweep-{multi_run.level_name}--{timestamp}"
+    records = run_sweep(sweep_config, AGENT_CONFIG, multi_run.level_name, sweep_dir)
+
+    for record in records:
+        status = "failed" if record["exitcode"] else "pruned" if record["pruned"] else "done"
+        score = "-" if record["final_train_score"] is None else "%.1f" % record["final_train_score"]
+        print(f"{record['name']}: {status} after {record['epochs']} epochs, train score {score}, {record['overrides']}")
@@ -0,0 +1,87 @@
+import multiprocessing as mp
+import warnings
+
+import torch
+
+
+class SharedWeights:
+    """
+    Shared-memory copy of a model's state_dict, published by one process
+    (the learner) and pulled by any number of others (actors, evaluators)
+    without pickling or disk I/O.
+
+    All tensors live in one flat byte buffer, each as a view of its own dtype
+    and shape. A version counter, odd while a publish is in progress, lets
+    readers skip the copy when nothing changed and retry a copy that raced
+    with a publish. Pass the object to the child processes when starting them.
+    """
+
+    def __init__(self, model, ctx=None):
+        ctx = ctx or mp
+        self._layout = []
+        offset = 0
+        for name, tensor in model.state_dict().items():
+            nbytes = tensor.numel() * tensor.element_size()
+            self._layout.append((name, tensor.dtype, tuple(tensor.shape), offset, nbytes))
+            # keep every view aligned for its dtype
+            offset += -(-nbytes // 8) * 8
+
+        self._raw = ctx.RawArray("B", max(offset, 1))
+        self._version = ctx.RawValue("q", 0)
+        self._views = None
+        self.publish(model)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_views"] = None
+        return state
+
+    def _tensors(self):
+        if self._views is None:
+            with warnings.catch_warnings():
+                # the buffer is shared memory, writing to it is the point
+                warnings.simplefilter("ignore", UserWarning)
+                flat = torch.frombuffer(self._raw, dtype=torch.uint8)
+            self._views = {
+                name: flat[offset:offset + nbytes].view(dtype).view(shape)
+                for name, dtype, shape, offset, nbytes in self._layout
+            }
+        return self._views
+
+    @property
+    def version(self):
+        return self._version.value
+
+    def publish(self, model):
+        """Copies the state_dict of model into shared memory and returns the new version"""
+        views = self._tensors()
+        version = self._version.value
+        self._version.value = version + 1
+        with torch.no_grad():
+            for name, tensor in model.state_dict().items():
+                views[name].copy_(tensor)
+        self._version.value = version + 2
+        return version + 2
+
+    def pull(self, model, version=0):
+        """
+        Copies the published weights into model if they are newer than version,
+        the version model already holds. Returns the version model holds after.
+        """
+        if self._version.value == version:
+            return version
+
+        views = self._tensors()
+        state_dict = model.state_dict()
+        while True:
+            latest = self._version.value
+            if latest == version:
+                return version
+            if latest % 2:
+                continue
+            with torch.no_grad():
+                for name, tensor in state_dict.items():
+                    tensor.copy_(views[name])
+            # a publish that started during the copy may have torn it
+            if self._version.value == latest:
+                return latest